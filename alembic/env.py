@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import pool
@@ -5,13 +6,17 @@ from sqlalchemy.engine import Connection
 from alembic import context
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
-from app.database import Base  # Подключаем твой Base!
+from app.database import Base, DATABASE_URL  # Подключаем твой Base!
 
 # Alembic Config
 config = context.config
 
-# Логирование
-if config.config_file_name is not None:
+# URL из окружения (DATABASE_URL) важнее значения в alembic.ini
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
+# Логирование (при запуске из приложения — app/core/startup.py — своё, не трогаем)
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
 
 # Метаданные моделей
@@ -0,0 +1,30 @@
+"""add composite indexes for history pagination
+
+Revision ID: 4c7e2d9a1f36
+Revises: b28e81239a69
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7e2d9a1f36'
+down_revision: Union[str, Sequence[str], None] = 'b28e81239a69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_sessions_user_id_created_at', 'sessions', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_session_id_created_at', 'messages', ['session_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_session_id_created_at', table_name='messages')
+    op.drop_index('ix_sessions_user_id_created_at', table_name='sessions')
@@ -0,0 +1,31 @@
+"""add rolling summary to sessions
+
+Revision ID: 9a3b5e7c2d41
+Revises: 4c7e2d9a1f36
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3b5e7c2d41'
+down_revision: Union[str, Sequence[str], None] = '4c7e2d9a1f36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('sessions', sa.Column('summary_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('summary_message_id')
+        batch_op.drop_column('summary')
@@ -0,0 +1,110 @@
+"""ON DELETE CASCADE for history foreign keys, AUTOINCREMENT for users/sessions
+
+Revision ID: a7d5c3b9e2f1
+Revises: f4a8d2c6e1b3
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d5c3b9e2f1'
+down_revision: Union[str, Sequence[str], None] = 'f4a8d2c6e1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Внешние ключи в SQLite созданы без имён: при пересоздании таблицы
+# отражённые ключи получают имена по этому шаблону, и их можно заменить
+NAMING_CONVENTION = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+# (таблица, колонка, родитель, AUTOINCREMENT после upgrade / после downgrade)
+_FOREIGN_KEYS = [
+    ('sessions', 'user_id', 'users', True, False),
+    ('messages', 'session_id', 'sessions', True, True),
+    ('message_archives', 'session_id', 'sessions', False, False),
+]
+
+
+def _normalize(col: str) -> str:
+    return f"replace(replace({col}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Представление и триггеры FTS ссылаются на messages: пересоздание таблицы
+# их удаляет (а view ломает RENAME), поэтому снимаем их до и ставим после.
+_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP VIEW IF EXISTS messages_fts_source",
+]
+
+_FTS_CREATE = [
+    f"""CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, {_normalize("text")} AS text FROM messages""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_normalize("old.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_normalize("old.text")});
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+    END""",
+]
+
+# Строки, чьих родителей уже нет (раньше внешние ключи не проверялись):
+# с PRAGMA foreign_keys = ON они мешали бы любой записи в эти таблицы
+_ORPHANS = [
+    "DELETE FROM sessions WHERE user_id NOT IN (SELECT id FROM users)",
+    "DELETE FROM message_archives WHERE session_id NOT IN (SELECT id FROM sessions)",
+    "DELETE FROM messages WHERE session_id NOT IN (SELECT id FROM sessions)",
+]
+
+
+def _recreate(cascade: bool) -> None:
+    for ddl in _FTS_DROP:
+        op.execute(ddl)
+
+    with op.batch_alter_table(
+        'users', recreate='always', table_kwargs={'sqlite_autoincrement': cascade}
+    ):
+        pass
+
+    for table, column, parent, autoincrement_up, autoincrement_down in _FOREIGN_KEYS:
+        name = NAMING_CONVENTION["fk"] % {
+            "table_name": table, "column_0_name": column, "referred_table_name": parent,
+        }
+        with op.batch_alter_table(
+            table,
+            recreate='always',
+            naming_convention=NAMING_CONVENTION,
+            table_kwargs={'sqlite_autoincrement': autoincrement_up if cascade else autoincrement_down},
+        ) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(
+                name, parent, [column], ['id'], ondelete='CASCADE' if cascade else None
+            )
+
+    for ddl in _FTS_CREATE:
+        op.execute(ddl)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for statement in _ORPHANS:
+        op.execute(statement)
+    _recreate(cascade=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _recreate(cascade=False)
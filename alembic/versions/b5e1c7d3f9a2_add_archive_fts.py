@@ -0,0 +1,67 @@
+"""keep archived messages searchable: archive_fts
+
+Revision ID: b5e1c7d3f9a2
+Revises: a7d5c3b9e2f1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e1c7d3f9a2'
+down_revision: Union[str, Sequence[str], None] = 'a7d5c3b9e2f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS archive_fts USING fts5(
+            text,
+            sid,
+            role UNINDEXED,
+            created_at UNINDEXED,
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )"""
+    )
+    op.execute(
+        """CREATE TRIGGER IF NOT EXISTS archive_fts_ad AFTER DELETE ON message_archives BEGIN
+            DELETE FROM archive_fts WHERE rowid IN (
+                SELECT rowid FROM archive_fts WHERE sid MATCH old.session_id
+            );
+        END"""
+    )
+
+    # Уже заархивированные сессии: распаковываем blob и индексируем текст
+    bind = op.get_bind()
+    insert = sa.text(
+        "INSERT INTO archive_fts(rowid, text, sid, role, created_at) "
+        "VALUES (:id, :text, :sid, :role, :created_at)"
+    )
+    for session_id, data in bind.execute(sa.text("SELECT session_id, data FROM message_archives")):
+        rows = [
+            {
+                "id": msg_id,
+                "text": body.replace("ё", "е").replace("Ё", "Е"),
+                "sid": str(session_id),
+                "role": role,
+                "created_at": created_at.replace("T", " ") if created_at else None,
+            }
+            for msg_id, role, body, created_at in json.loads(zlib.decompress(data))
+        ]
+        if rows:
+            bind.execute(insert, rows)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS archive_fts_ad")
+    op.execute("DROP TABLE IF EXISTS archive_fts")
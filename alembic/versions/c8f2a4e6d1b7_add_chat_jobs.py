@@ -0,0 +1,46 @@
+"""chat_jobs: job status shared between worker processes
+
+Revision ID: c8f2a4e6d1b7
+Revises: b5e1c7d3f9a2
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8f2a4e6d1b7'
+down_revision: Union[str, Sequence[str], None] = 'b5e1c7d3f9a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'chat_jobs',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), server_default='queued', nullable=False),
+        sa.Column('answer', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('seq'),
+        sa.UniqueConstraint('id'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_chat_jobs_session_id_seq', 'chat_jobs', ['session_id', 'seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_jobs_session_id_seq', table_name='chat_jobs')
+    op.drop_table('chat_jobs')
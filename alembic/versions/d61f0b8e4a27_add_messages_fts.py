@@ -0,0 +1,68 @@
+"""add FTS5 index over messages.text
+
+Revision ID: d61f0b8e4a27
+Revises: 9a3b5e7c2d41
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd61f0b8e4a27'
+down_revision: Union[str, Sequence[str], None] = '9a3b5e7c2d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _normalize(col: str) -> str:
+    return f"replace(replace({col}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        f"""CREATE VIEW IF NOT EXISTS messages_fts_source AS
+            SELECT id, {_normalize("text")} AS text FROM messages"""
+    )
+    op.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            text,
+            content='messages_fts_source',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )"""
+    )
+    op.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+        END"""
+    )
+    op.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, text)
+            VALUES ('delete', old.id, {_normalize("old.text")});
+        END"""
+    )
+    op.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, text)
+            VALUES ('delete', old.id, {_normalize("old.text")});
+            INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+        END"""
+    )
+    # Заполняем индекс уже существующими сообщениями
+    op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS messages_fts_ai")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
+    op.execute("DROP VIEW IF EXISTS messages_fts_source")
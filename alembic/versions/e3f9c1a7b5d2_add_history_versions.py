@@ -0,0 +1,32 @@
+"""add version stamps for conditional GET
+
+Revision ID: e3f9c1a7b5d2
+Revises: d61f0b8e4a27
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f9c1a7b5d2'
+down_revision: Union[str, Sequence[str], None] = 'd61f0b8e4a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('history_version', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('sessions', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('history_version')
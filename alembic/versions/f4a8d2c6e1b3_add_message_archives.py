@@ -0,0 +1,86 @@
+"""add message_archives for cold sessions, AUTOINCREMENT for messages.id
+
+Revision ID: f4a8d2c6e1b3
+Revises: e3f9c1a7b5d2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a8d2c6e1b3'
+down_revision: Union[str, Sequence[str], None] = 'e3f9c1a7b5d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _normalize(col: str) -> str:
+    return f"replace(replace({col}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Представление и триггеры FTS ссылаются на messages: пересоздание таблицы
+# их удаляет (а view ломает RENAME), поэтому снимаем их до и ставим после.
+# Сам индекс messages_fts не трогаем — rowid сообщений сохраняются.
+_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP VIEW IF EXISTS messages_fts_source",
+]
+
+_FTS_CREATE = [
+    f"""CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, {_normalize("text")} AS text FROM messages""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_normalize("old.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_normalize("old.text")});
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_normalize("new.text")});
+    END""",
+]
+
+
+def _recreate_messages(autoincrement: bool) -> None:
+    for ddl in _FTS_DROP:
+        op.execute(ddl)
+    with op.batch_alter_table(
+        'messages', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}
+    ):
+        pass
+    for ddl in _FTS_CREATE:
+        op.execute(ddl)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Архивация удаляет сообщения; без AUTOINCREMENT SQLite выдал бы
+    # новым сообщениям их id
+    _recreate_messages(autoincrement=True)
+    op.create_table(
+        'message_archives',
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('raw_bytes', sa.Integer(), nullable=False),
+        sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_message_preview', sa.Text(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ),
+        sa.PrimaryKeyConstraint('session_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('message_archives')
+    _recreate_messages(autoincrement=False)
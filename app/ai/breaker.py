@@ -0,0 +1,135 @@
+import time
+from collections import deque
+
+import httpx
+
+from app.core.config import (
+    AI_BREAKER_WINDOW,
+    AI_BREAKER_MIN_CALLS,
+    AI_BREAKER_FAILURE_RATE,
+    AI_BREAKER_OPEN_SECONDS,
+    AI_BREAKER_HALF_OPEN_PROBES,
+)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Цепь разомкнута: AI недавно отказывал, вызов не делаем."""
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Что считается отказом upstream: сетевые ошибки, таймауты, 5xx и 429.
+    Остальные 4xx — ошибка запроса, сервис при этом жив.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (httpx.HTTPError, ValueError))
+
+
+class CircuitBreaker:
+    """
+    closed: вызовы идут, исходы копятся в скользящем окне window секунд.
+    Набралось min_calls и доля отказов >= failure_rate — open: все вызовы
+    сразу получают CircuitOpen, без ожидания таймаутов. Через open_seconds —
+    half_open: пропускается до probes пробных вызовов; успех замыкает цепь,
+    отказ снова размыкает.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        min_calls: int,
+        failure_rate: float,
+        open_seconds: float,
+        probes: int,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes = max(1, probes)
+        self.state = CLOSED
+        self._outcomes: deque[tuple[float, bool]] = deque()  # (время, отказ)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def allow(self) -> bool:
+        """
+        Можно ли звать upstream. True — вызов разрешён (в half_open это
+        проба, её исход обязательно передать в record). Иначе CircuitOpen.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.short_circuited += 1
+                raise CircuitOpen()
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                self.short_circuited += 1
+                raise CircuitOpen()
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def record(self, failed: bool | None, probe: bool = False) -> None:
+        """failed=None — исход неизвестен (вызов отменили): только освобождаем пробу."""
+        now = time.monotonic()
+        if probe:
+            if failed is None:
+                self._probes_in_flight -= 1
+                return
+            self._probes_in_flight -= 1
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+            return
+        if self.state != CLOSED or failed is None:
+            return
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        self._trim(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "state_code": _STATE_CODES[self.state],
+            "window_calls": calls,
+            "window_failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+ai_breaker = CircuitBreaker(
+    AI_BREAKER_WINDOW,
+    AI_BREAKER_MIN_CALLS,
+    AI_BREAKER_FAILURE_RATE,
+    AI_BREAKER_OPEN_SECONDS,
+    AI_BREAKER_HALF_OPEN_PROBES,
+)
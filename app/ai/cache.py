@@ -0,0 +1,32 @@
+import hashlib
+import json
+
+from app.core.cache import TTLCache
+from app.core.config import AI_CACHE_TTL, AI_CACHE_MAX_SIZE
+
+
+def normalize_query(query: str) -> str:
+    """Регистр и пробелы не влияют на ключ: «Срок  НДС?» == «срок ндс?»."""
+    return " ".join(query.casefold().split())
+
+
+def make_cache_key(query: str, history: list) -> str:
+    """Ключ = нормализованный вопрос + хэш истории, которая уходит в AI."""
+    history_hash = hashlib.sha256(
+        json.dumps(history, ensure_ascii=False, sort_keys=True).encode()
+    ).hexdigest()
+    return f"{normalize_query(query)}|{history_hash}"
+
+
+class AnswerCache(TTLCache):
+    """Кэш ответов AI: наружу отдаются копии, чтобы их можно было менять."""
+
+    def get(self, key: str) -> dict | None:
+        value = super().get(key)
+        return dict(value) if value is not None else None
+
+    def set(self, key: str, value: dict) -> None:
+        super().set(key, dict(value))
+
+
+answer_cache = AnswerCache(max_size=AI_CACHE_MAX_SIZE, ttl=AI_CACHE_TTL)
@@ -1,24 +1,324 @@
+import asyncio
+import importlib.util
+import json
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
 import httpx
-from app.core.config import AI_BASE_URL, AI_API_KEY, AI_TIMEOUT
+from app.core.config import (
+    AI_BASE_URL,
+    AI_API_KEY,
+    AI_CONNECT_TIMEOUT,
+    AI_READ_TIMEOUT,
+    AI_WRITE_TIMEOUT,
+    AI_POOL_TIMEOUT,
+    AI_MAX_CONNECTIONS,
+    AI_MAX_KEEPALIVE_CONNECTIONS,
+    AI_KEEPALIVE_EXPIRY,
+    AI_HTTP2,
+    AI_RETRIES,
+    AI_RETRY_BACKOFF,
+    AI_RETRY_BACKOFF_MAX,
+    AI_HEDGE_PERCENTILE,
+    AI_HEDGE_MIN_SAMPLES,
+)
+from app.ai.cache import answer_cache, make_cache_key
+from app.ai.singleflight import ai_singleflight
+from app.ai.limiter import UpstreamBusy, upstream_limiter
+from app.ai.breaker import ai_breaker, is_upstream_failure
+from app.ai.retrieval import retrieval_index
+from app.core.metrics import ai_upstream_duration, ai_upstream_requests
+
+T = TypeVar("T")
+
+# --- Общий на процесс клиент (создаётся в startup, закрывается в shutdown) ---
+_client: httpx.AsyncClient | None = None
+
+
+def build_ai_client() -> httpx.AsyncClient:
+    """
+    Собирает AsyncClient с пулом keep-alive соединений
+    и отдельными таймаутами на connect/read/write/pool.
+    """
+    if AI_HTTP2 and importlib.util.find_spec("h2") is None:
+        raise RuntimeError("AI_HTTP2=1 требует пакет h2: pip install 'httpx[http2]'")
+
+    return httpx.AsyncClient(
+        base_url=AI_BASE_URL,
+        headers={
+            "Content-Type": "application/json",
+            "X-API-Key": AI_API_KEY
+        },
+        timeout=httpx.Timeout(
+            connect=AI_CONNECT_TIMEOUT,
+            read=AI_READ_TIMEOUT,
+            write=AI_WRITE_TIMEOUT,
+            pool=AI_POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=AI_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=AI_KEEPALIVE_EXPIRY,
+        ),
+        http2=AI_HTTP2,
+    )
+
+
+async def init_ai_client() -> None:
+    global _client
+    if _client is None:
+        _client = build_ai_client()
+
+
+async def close_ai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_ai_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий клиент. Если приложение не прошло startup
+    (скрипты, консоль), создаёт его лениво.
+    """
+    global _client
+    if _client is None:
+        _client = build_ai_client()
+    return _client
+
+
+async def get_cached_answer(query: str, history: list) -> dict | None:
+    """
+    Ответ без похода в AI: из кэша или из локального индекса FAQ.
+    Индекс знает только вопросы без контекста, поэтому спрашиваем его
+    лишь в начале беседы: «Когда платить?» посреди разговора об УСН —
+    не вопрос про НДС.
+    """
+    cached = answer_cache.get(make_cache_key(query, history))
+    if cached is not None or history:
+        return cached
+    return await retrieval_index.answer(query)
+
+
+def cache_answer(query: str, history: list, ai_response: dict) -> None:
+    answer_cache.set(make_cache_key(query, history), ai_response)
+
+
+def invalidate_cached_answer(query: str, history: list) -> bool:
+    return answer_cache.invalidate(make_cache_key(query, history))
+
+
+def observe_upstream(mode: str, started: float, status) -> None:
+    ok = isinstance(status, int) and status < 400
+    ai_upstream_duration.observe(time.perf_counter() - started, mode, "ok" if ok else "error")
+    ai_upstream_requests.inc(mode, status)
+
+
+# ======================================================
+#        ПОВТОРЫ, HEDGING И CIRCUIT BREAKER
+# ======================================================
+
+# Запрос до AI точно не дошёл или AI сам просит повторить —
+# повтор безопасен (ответ без побочных эффектов)
+RETRYABLE_STATUSES = {502, 503, 504}
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_recent_latencies: deque[float] = deque(maxlen=500)
+_resilience = {"retries": 0, "hedges": 0, "hedge_wins": 0}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUSES
+    return isinstance(exc, RETRYABLE_ERRORS)
+
+
+async def with_retries(fn: Callable[[], Awaitable[T]]) -> T:
+    """До AI_RETRIES повторов с экспоненциальной паузой и full jitter."""
+    for attempt in range(AI_RETRIES + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == AI_RETRIES or not is_retryable(e):
+                raise
+            _resilience["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(AI_RETRY_BACKOFF_MAX, AI_RETRY_BACKOFF * 2 ** attempt)))
+
+
+def hedge_delay() -> float | None:
+    if not AI_HEDGE_PERCENTILE or len(_recent_latencies) < AI_HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_recent_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * AI_HEDGE_PERCENTILE / 100))]
+
+
+async def with_hedging(fn: Callable[[], Awaitable[T]]) -> T:
+    """
+    Если ответа нет дольше перцентиля AI_HEDGE_PERCENTILE недавних латентностей
+    и в upstream_limiter сразу нашёлся свободный слот, параллельно идёт второй
+    такой же запрос; берётся первый успешный, второй отменяется. Второй
+    запрос занимает свой слот (основной идёт в слоте вызывающего) и отдаёт
+    его, когда закончится или будет отменён: лимит не превышается.
+    """
+    delay = hedge_delay()
+    if delay is None:
+        return await fn()
+
+    tasks = [asyncio.ensure_future(fn())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and await upstream_limiter.try_acquire():
+            _resilience["hedges"] += 1
+            hedge = asyncio.ensure_future(fn())
+            # Колбэк срабатывает и при отмене до первого шага задачи
+            hedge.add_done_callback(lambda _: upstream_limiter.release())
+            tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        _resilience["hedge_wins"] += 1
+                    return task.result()
+        return tasks[0].result()  # оба упали — отдаём ошибку основного
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def guarded(fn: Callable[[], Awaitable[T]]) -> T:
+    """
+    Вызов через ai_breaker: при разомкнутой цепи сразу CircuitOpen,
+    иначе исход вызова записывается в окно breaker'а.
+    Перегрузка собственного лимитера (UpstreamBusy) отказом AI не считается.
+    """
+    probe = ai_breaker.allow()
+    failed = None
+    try:
+        result = await fn()
+        failed = False
+        return result
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        failed = is_upstream_failure(e)
+        raise
+    finally:
+        ai_breaker.record(failed, probe)
+
+
+def resilience_stats() -> dict:
+    delay = hedge_delay()
+    return {**_resilience, "hedge_delay_ms": round(delay * 1000, 1) if delay else 0.0}
 
 
 async def ask_ai_assistant(
     query: str,
     session_id: str,
-    history: list
+    history: list,
+    use_cache: bool = True
 ) -> dict:
-    async with httpx.AsyncClient(timeout=AI_TIMEOUT) as client:
-        response = await client.post(
-            f"{AI_BASE_URL}/assistant/query",
-            headers={
-                "Content-Type": "application/json",
-                "X-API-Key": AI_API_KEY
-            },
-            json={
-                "query": query,
-                "session_id": session_id,
-                "history": history
-            }
-        )
+    """
+    Спрашивает AI. Повторный вопрос с той же историей отдаётся из кэша,
+    пересказ частого вопроса — из локального индекса (app/ai/retrieval.py),
+    оба без похода в upstream; use_cache=False пропускает и кэш, и индекс,
+    но свежий ответ всё равно кладётся в кэш.
+    Одинаковые запросы, пришедшие одновременно, ждут один общий вызов
+    upstream (session_id в нём — от первого из них).
+    Сам вызов занимает слот upstream_limiter; не дождался — UpstreamBusy.
+    Вызов идёт через circuit breaker (разомкнут — CircuitOpen сразу),
+    с повторами транзиентных ошибок и, если включено, hedging.
+    """
+    key = make_cache_key(query, history)
+    if use_cache:
+        cached = await get_cached_answer(query, history)
+        if cached is not None:
+            return cached
+
+    async def post_once() -> dict:
+        client = get_ai_client()
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                "/assistant/query",
+                json={
+                    "query": query,
+                    "session_id": session_id,
+                    "history": history
+                }
+            )
+        except httpx.HTTPError as e:
+            observe_upstream("query", started, type(e).__name__)
+            raise
+        observe_upstream("query", started, response.status_code)
         response.raise_for_status()
+        _recent_latencies.append(time.perf_counter() - started)
         return response.json()
+
+    async def call_upstream() -> dict:
+        async with upstream_limiter.slot():
+            ai_response = await with_hedging(lambda: with_retries(post_once))
+        answer_cache.set(key, ai_response)
+        return ai_response
+
+    return dict(await ai_singleflight.do(key, lambda: guarded(call_upstream)))
+
+
+async def stream_ai_assistant(
+    query: str,
+    session_id: str,
+    history: list
+) -> AsyncIterator[str]:
+    """
+    Потоковый вариант ask_ai_assistant: AI отвечает Server-Sent Events
+    вида `data: {"delta": "..."}` и завершает поток `data: [DONE]`.
+    Отдаёт куски текста по мере генерации. После первого куска повторять
+    нельзя, поэтому здесь только circuit breaker, без retry и hedging.
+    """
+    client = get_ai_client()
+    status = "incomplete"
+    probe = ai_breaker.allow()
+    failed = None
+    try:
+        async with upstream_limiter.slot():
+            started = time.perf_counter()
+            try:
+                async with client.stream(
+                    "POST",
+                    "/assistant/query",
+                    json={
+                        "query": query,
+                        "session_id": session_id,
+                        "history": history,
+                        "stream": True
+                    }
+                ) as response:
+                    status = response.status_code
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        delta = json.loads(data).get("delta")
+                        if delta:
+                            yield delta
+                failed = False
+            except httpx.HTTPError as e:
+                if status == "incomplete":
+                    status = type(e).__name__
+                raise
+            finally:
+                observe_upstream("stream", started, status)
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        failed = is_upstream_failure(e)
+        raise
+    finally:
+        ai_breaker.record(failed, probe)
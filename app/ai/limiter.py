@@ -0,0 +1,95 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
+
+from app.core.config import AI_MAX_IN_FLIGHT, AI_QUEUE_SIZE, AI_QUEUE_TIMEOUT
+
+
+class UpstreamBusy(Exception):
+    """Слот к AI не достался: очередь полна или ожидание вышло."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("AI upstream is saturated")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class UpstreamLimiter:
+    """
+    Ограничивает число одновременных вызовов AI на процесс.
+    Сверх лимита запрос ждёт в короткой очереди не дольше queue_timeout;
+    если очередь уже полна или время вышло — UpstreamBusy, и клиент
+    сразу получает 503 вместо ожидания таймаута upstream.
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def check(self) -> None:
+        """Быстрая проверка до начала работы (для стрима, где 503 потом не отдать)."""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise UpstreamBusy(self.queue_timeout)
+
+    def has_capacity(self) -> bool:
+        return self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self.waiting)
+
+    async def try_acquire(self) -> bool:
+        """
+        Слот без ожидания (для дополнительного hedge-запроса): False, если
+        свободных нет или в очереди уже кто-то ждёт. Занятый слот — release().
+        """
+        if self.max_in_flight <= 0:
+            return True
+        if not self.has_capacity():
+            return False
+        await self._semaphore.acquire()  # свободен — возвращается без ожидания
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        if self.max_in_flight <= 0:
+            return
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.max_in_flight <= 0:
+            yield
+            return
+        if self._semaphore.locked():
+            self.check()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise UpstreamBusy(self.queue_timeout)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+upstream_limiter = UpstreamLimiter(AI_MAX_IN_FLIGHT, AI_QUEUE_SIZE, AI_QUEUE_TIMEOUT)
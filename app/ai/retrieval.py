@@ -0,0 +1,548 @@
+"""
+Локальные ответы на частые вопросы — до похода в AI.
+
+Кэш ответов (app/ai/cache.py) ловит только дословный повтор вопроса,
+а бухгалтерские вопросы чаще всего — пересказы пары сотен типовых.
+Здесь вопрос сравнивается с индексом известных вопросов: курируемый
+FAQ (app/ai/faq.json) плюс одобренные администратором ответы AI на
+первые вопросы сессий (approved.json в каталоге индекса). Индекс общий
+для всех пользователей, поэтому из истории сам он ничего не берёт:
+кандидатов смотрит и одобряет человек (/admin/retrieval/...), а ответ
+удалённой сессии или пользователя уходит из индекса при обновлении.
+Ответ берётся из индекса, если косинусное сходство не ниже
+RETRIEVAL_THRESHOLD и у вопросов совпадают ключевые термины (KEY_TERMS):
+налог, форма, ООО/ИП. По n-граммам «НДФЛ» почти равно «НДС», а «ООО»
+отличается от «ИП» парой символов — без этой проверки индекс уверенно
+отвечал бы на соседний вопрос.
+
+Векторы — TF-IDF по символьным n-граммам, захэшированным в HASH_DIM
+корзин (словарь не нужен, новые документы не меняют размерность).
+Матрица хранится на диске в CSR-виде и открывается через np.memmap:
+все воркеры делят одни страницы в page cache. Файлы только дописываются;
+сколько строк в них действительно, знает meta.json, который заменяется
+атомарно. Дописывает один процесс за раз (файловая блокировка),
+IDF и нормы строк каждый воркер пересчитывает при перечитывании.
+Новые одобренные ответы дописываются в текущее поколение; смена FAQ
+или удаление из одобренных (отзыв, вытеснение, удалённая сессия) —
+новое поколение файлов, собранное заново.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from app.ai.cache import normalize_query
+from app.core.config import (
+    RETRIEVAL_ENABLED,
+    RETRIEVAL_DIR,
+    RETRIEVAL_FAQ_PATH,
+    RETRIEVAL_THRESHOLD,
+    RETRIEVAL_REFRESH_INTERVAL,
+    RETRIEVAL_MAX_APPROVED,
+)
+from app.core.startup import file_lock
+from app.database import ReadSessionLocal
+from app.models import Message, MessageArchive, Session
+
+logger = logging.getLogger(__name__)
+
+FAQ_PATH = Path(__file__).with_name("faq.json")
+
+INDEX_FORMAT = 3
+HASH_DIM = 2 ** 18
+NGRAM_SIZES = (3, 4, 5)
+MIN_QUESTION_CHARS = 10
+SEARCH_CANDIDATES = 5  # сколько ближайших вопросов проверять на ключевые термины
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+# Термины, которые меняют ответ: у вопроса из индекса набор должен
+# совпасть с набором запроса. Порядок важен — найденное вырезается,
+# поэтому «3-НДФЛ» не засчитывается ещё и как «НДФЛ».
+KEY_TERMS = [(re.compile(pattern), term) for pattern, term in [
+    (r"\b3\s*-?\s*ндфл", "3-ндфл"),
+    (r"\b6\s*-?\s*ндфл", "6-ндфл"),
+    (r"ндфл|налог\w* на доходы? физ", "ндфл"),
+    (r"\bндс\b|добавленн\w* стоимост", "ндс"),
+    (r"\bусн\b|упрощ[её]нк|упрощенн\w* систем", "усн"),
+    (r"патент|\bпсн\b", "патент"),
+    (r"\bенп\b|\bенс\b|един\w* налогов", "енп"),
+    (r"прибыл", "прибыль"),
+    (r"имуществ", "имущество"),
+    (r"транспортн", "транспортный"),
+    (r"земельн", "земельный"),
+    (r"самозанят|\bнпд\b|налог\w* на профессиональн", "нпд"),
+    (r"\bрсв\b", "рсв"),
+    (r"\bефс", "ефс"),
+    (r"персонифицир", "персонифицированные"),
+    (r"взнос", "взносы"),
+    (r"\bип\b|предпринимател", "ип"),
+    (r"\bооо\b|юрлиц|юридическ\w* лиц", "ооо"),
+    (r"кадров", "кадровые"),
+    (r"первичн", "первичные"),
+]]
+
+# Файлы одного поколения: имя -> dtype
+_ARRAYS = {
+    "indptr": np.int64,    # начало строки в indices/data (docs + 1)
+    "indices": np.int32,   # корзины n-грамм
+    "data": np.float32,    # 1 + log(tf)
+    "offsets": np.int64,   # начало документа в docs (docs + 1)
+    "docs": np.uint8,      # JSON-строки {"q", "a", "src"[, "sid"]}
+}
+
+
+# --- Векторизация ---
+
+def vectorize(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Текст -> (отсортированные корзины n-грамм, сублинейный tf)."""
+    norm = f" {normalize_query(_PUNCT_RE.sub(' ', text))} "
+    grams = [norm[i:i + n] for n in NGRAM_SIZES for i in range(len(norm) - n + 1)]
+    buckets = np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) & (HASH_DIM - 1) for g in grams),
+        dtype=np.int64,
+        count=len(grams),
+    )
+    indices, counts = np.unique(buckets, return_counts=True)
+    return indices.astype(np.int32), (1 + np.log(counts)).astype(np.float32)
+
+
+def key_terms(text: str) -> frozenset[str]:
+    """Ключевые термины вопроса: «Срок 3-НДФЛ для ИП» -> {"3-ндфл", "ип"}."""
+    text = normalize_query(text).replace("ё", "е")
+    found = set()
+    for pattern, term in KEY_TERMS:
+        text, count = pattern.subn(" ", text)
+        if count:
+            found.add(term)
+    return frozenset(found)
+
+
+# ======================================================
+#                  ФАЙЛЫ ИНДЕКСА
+# ======================================================
+
+def _path(directory: Path, generation: int, name: str) -> Path:
+    return directory / f"{generation}.{name}"
+
+
+def _sizes(meta: dict) -> dict[str, int]:
+    """Сколько элементов каждого массива покрывает meta."""
+    return {
+        "indptr": meta["docs"] + 1,
+        "indices": meta["nnz"],
+        "data": meta["nnz"],
+        "offsets": meta["docs"] + 1,
+        "docs": meta["docs_bytes"],
+    }
+
+
+def read_meta(directory: Path) -> dict | None:
+    try:
+        meta = json.loads((directory / "meta.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get("format") != INDEX_FORMAT or meta.get("hash_dim") != HASH_DIM \
+            or meta.get("ngrams") != list(NGRAM_SIZES):
+        return None
+    return meta
+
+
+def _replace_file(path: Path, text: str) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _write_meta(directory: Path, meta: dict) -> None:
+    _replace_file(directory / "meta.json", json.dumps(meta))
+
+
+def read_approved(directory: Path) -> list[dict]:
+    """Одобренные ответы из истории: [{"q", "a", "src": "history", "sid"}]."""
+    try:
+        return json.loads((directory / "approved.json").read_text())
+    except FileNotFoundError:
+        return []
+
+
+def _write_approved(directory: Path, docs: list[dict]) -> None:
+    _replace_file(directory / "approved.json", json.dumps(docs, ensure_ascii=False, indent=1))
+
+
+def _docs_hash(docs: list[dict]) -> str:
+    return hashlib.sha256(json.dumps(docs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _new_generation(directory: Path, previous: dict | None, faq_hash: str) -> dict:
+    generation = (previous["generation"] + 1) if previous else 1
+    for name, dtype in _ARRAYS.items():
+        with open(_path(directory, generation, name), "wb") as f:
+            if name in ("indptr", "offsets"):
+                f.write(np.zeros(1, dtype=dtype).tobytes())
+    return {
+        "format": INDEX_FORMAT,
+        "hash_dim": HASH_DIM,
+        "ngrams": list(NGRAM_SIZES),
+        "generation": generation,
+        "faq_hash": faq_hash,
+        # Сколько первых одобренных уже в файлах и хэш этого префикса
+        "approved_count": 0,
+        "approved_hash": _docs_hash([]),
+        "docs": 0,
+        "nnz": 0,
+        "docs_bytes": 0,
+    }
+
+
+def _append(directory: Path, meta: dict, docs: list[dict]) -> dict:
+    """Дописывает документы в файлы поколения и возвращает новую meta (ещё не записанную)."""
+    rows = [(doc, *vectorize(doc["q"])) for doc in docs]
+    rows = [row for row in rows if len(row[1])]
+    if not rows:
+        return meta
+
+    blobs = [json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n" for doc, _, _ in rows]
+    parts = {
+        "indptr": meta["nnz"] + np.cumsum([len(indices) for _, indices, _ in rows], dtype=np.int64),
+        "indices": np.concatenate([indices for _, indices, _ in rows]),
+        "data": np.concatenate([tf for _, _, tf in rows]),
+        "offsets": meta["docs_bytes"] + np.cumsum([len(b) for b in blobs], dtype=np.int64),
+        "docs": np.frombuffer(b"".join(blobs), dtype=np.uint8),
+    }
+    # Хвост после прерванной записи (meta его не покрывает) отрезаем
+    sizes = _sizes(meta)
+    for name, dtype in _ARRAYS.items():
+        path = _path(directory, meta["generation"], name)
+        os.truncate(path, sizes[name] * np.dtype(dtype).itemsize)
+        with open(path, "ab") as f:
+            f.write(parts[name].astype(dtype, copy=False).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    return {
+        **meta,
+        "docs": meta["docs"] + len(rows),
+        "nnz": meta["nnz"] + len(parts["indices"]),
+        "docs_bytes": meta["docs_bytes"] + len(parts["docs"]),
+    }
+
+
+def _drop_other_generations(directory: Path, generation: int) -> None:
+    # Открытые mmap у других воркеров переживают unlink
+    for path in directory.iterdir():
+        prefix = path.name.split(".", 1)[0]
+        if prefix.isdigit() and int(prefix) != generation:
+            path.unlink(missing_ok=True)
+
+
+class IndexView:
+    """Снимок индекса, открытый через mmap, с IDF и нормами строк."""
+
+    def __init__(self, directory: Path, meta: dict):
+        self.meta = meta
+        self.size = meta["docs"]
+        sizes = _sizes(meta)
+        arrays = {}
+        for name, dtype in _ARRAYS.items():
+            count = sizes[name]
+            path = _path(directory, meta["generation"], name)
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=(count,)) if count else np.zeros(0, dtype)
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.data = arrays["data"]
+        self.offsets = arrays["offsets"]
+        self.docs = arrays["docs"]
+
+        df = np.bincount(self.indices, minlength=HASH_DIM)
+        self.idf = (np.log((1 + self.size) / (1 + df)) + 1).astype(np.float32)
+        weighted = self.data * self.idf[self.indices]
+        if self.size:
+            self.norms = np.sqrt(np.add.reduceat(weighted * weighted, self.indptr[:-1]))
+        else:
+            self.norms = np.zeros(0, np.float32)
+
+        # Обратный индекс (корзина -> строки с весами tf * idf), чтобы запрос
+        # трогал только свои корзины, а не все nnz матрицы
+        order = np.argsort(self.indices, kind="stable")
+        rows = np.repeat(np.arange(self.size, dtype=np.int32), np.diff(self.indptr))
+        self.posting_rows = rows[order]
+        self.posting_weights = weighted[order]
+        self.posting_ptr = np.concatenate(([0], np.cumsum(df)))
+
+    def search(self, text: str, k: int = 1) -> list[tuple[float, int]]:
+        """До k ближайших документов: [(косинусное сходство, номер)], лучшие первыми."""
+        indices, tf = vectorize(text)
+        if not self.size or not len(indices):
+            return []
+        query = tf * self.idf[indices]
+        starts = self.posting_ptr[indices]
+        lengths = self.posting_ptr[indices + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return []
+        # Позиции всех постингов корзин запроса одним массивом, без циклов Python
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        scores = np.bincount(
+            self.posting_rows[positions],
+            weights=self.posting_weights[positions] * np.repeat(query, lengths),
+            minlength=self.size,
+        )
+        scores /= self.norms * float(np.linalg.norm(query))
+        k = min(k, self.size)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[n]), int(n)) for n in top if scores[n] > 0]
+
+    def doc(self, number: int) -> dict:
+        start, end = int(self.offsets[number]), int(self.offsets[number + 1])
+        return json.loads(self.docs[start:end].tobytes())
+
+
+# ======================================================
+#                       ИНДЕКС
+# ======================================================
+
+def load_faq(path: Path) -> tuple[list[dict], str]:
+    """FAQ [{"questions": [...], "answer": "..."}] -> документы и хэш файла."""
+    raw = path.read_bytes()
+    docs = [
+        {"q": question, "a": item["answer"], "src": "faq"}
+        for item in json.loads(raw)
+        for question in item["questions"]
+    ]
+    return docs, hashlib.sha256(raw).hexdigest()
+
+
+async def _openers(limit: int, session_id: int | None = None) -> list:
+    """
+    Первые вопросы сессий (новые первыми) и первый ответ AI на каждый.
+    Только начало беседы: ответ на него не зависит от контекста.
+    Сессии с архивом пропускаем — их первые сообщения уже не в messages.
+    """
+    from app.chat.router import AI_FALLBACK_ANSWER  # chat.router сам импортирует ai.client
+
+    question, earlier, reply = aliased(Message), aliased(Message), aliased(Message)
+    answer = (
+        select(reply.text)
+        .where(reply.session_id == question.session_id, reply.id > question.id, reply.role == "assistant")
+        .order_by(reply.id)
+        .limit(1)
+        .correlate(question)
+        .scalar_subquery()
+    )
+    opener = ~select(earlier.id).where(
+        earlier.session_id == question.session_id, earlier.id < question.id
+    ).correlate(question).exists()
+    not_archived = ~select(MessageArchive.session_id).where(
+        MessageArchive.session_id == question.session_id
+    ).correlate(question).exists()
+
+    query = (
+        select(question.session_id, question.text.label("question"), answer.label("answer"))
+        .where(question.role == "user", opener, not_archived)
+        .order_by(question.id.desc())
+        .limit(limit)
+    )
+    if session_id is not None:
+        query = query.where(question.session_id == session_id)
+
+    async with ReadSessionLocal() as db:
+        rows = (await db.execute(query)).all()
+    return [
+        row for row in rows
+        if row.answer is not None and row.answer != AI_FALLBACK_ANSWER and len(row.question) >= MIN_QUESTION_CHARS
+    ]
+
+
+async def _existing_sessions(session_ids: set[int]) -> set[int]:
+    async with ReadSessionLocal() as db:
+        result = await db.execute(select(Session.id).where(Session.id.in_(session_ids)))
+        return set(result.scalars().all())
+
+
+class RetrievalIndex:
+    def __init__(self, directory: str, faq_path: Path, threshold: float, enabled: bool = True):
+        self.directory = Path(directory)
+        self.faq_path = faq_path
+        self.threshold = threshold
+        self.enabled = enabled
+        self._view: IndexView | None = None
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.term_mismatches = 0
+        self.refresh_ms = 0.0
+
+    async def answer(self, query: str) -> dict | None:
+        """
+        Ответ из индекса: ближайший вопрос со сходством не ниже порога и теми же
+        ключевыми терминами; иначе None.
+        """
+        view = self._view
+        if view is None:
+            return None
+        # На большом индексе поиск — миллисекунды: выполняем в потоке, не в loop
+        found = await asyncio.to_thread(view.search, query, SEARCH_CANDIDATES)
+        terms = key_terms(query)
+        for score, number in found:
+            if score < self.threshold:
+                break
+            doc = view.doc(number)
+            if key_terms(doc["q"]) == terms:
+                self.hits += 1
+                return {"answer": doc["a"], "source": doc["src"], "score": round(score, 3)}
+            self.term_mismatches += 1
+        self.misses += 1
+        return None
+
+    # --- Обновление (под файловой блокировкой: пишет один процесс) ---
+
+    def _lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return file_lock(str(self.directory / "index.lock"))
+
+    def _prepare(self) -> dict:
+        """
+        Приводит файлы к FAQ и approved.json. Одобренные только добавились
+        в конец — дописывает их в текущее поколение; иначе собирает новое.
+        """
+        faq_docs, faq_hash = load_faq(self.faq_path)
+        approved = read_approved(self.directory)
+        meta = read_meta(self.directory)
+        if meta is not None and meta["faq_hash"] == faq_hash \
+                and meta["approved_count"] <= len(approved) \
+                and _docs_hash(approved[:meta["approved_count"]]) == meta["approved_hash"]:
+            added = approved[meta["approved_count"]:]
+            if not added:
+                return meta
+            meta = _append(self.directory, meta, added)
+            meta.update(approved_count=len(approved), approved_hash=_docs_hash(approved))
+            _write_meta(self.directory, meta)
+            logger.info("retrieval index: %s answers appended to generation %s", len(added), meta["generation"])
+            return meta
+
+        generation = _new_generation(self.directory, meta, faq_hash)
+        meta = _append(self.directory, generation, faq_docs + approved)
+        meta.update(approved_count=len(approved), approved_hash=_docs_hash(approved))
+        _write_meta(self.directory, meta)
+        _drop_other_generations(self.directory, meta["generation"])
+        logger.info("retrieval index rebuilt: generation %s, %s docs", meta["generation"], meta["docs"])
+        return meta
+
+    async def _forget_deleted(self) -> None:
+        """Убирает из одобренных ответы сессий, которых больше нет (удалены сами или с пользователем)."""
+        approved = await asyncio.to_thread(read_approved, self.directory)
+        if not approved:
+            return
+        alive = await _existing_sessions({doc["sid"] for doc in approved})
+        kept = [doc for doc in approved if doc["sid"] in alive]
+        if len(kept) < len(approved):
+            await asyncio.to_thread(_write_approved, self.directory, kept)
+            logger.info("retrieval: dropped %s answers of deleted sessions", len(approved) - len(kept))
+
+    async def refresh(self) -> None:
+        """Пересобирает индекс (если сменились источники) и перечитывает его."""
+        started = time.perf_counter()
+        async with self._lock():
+            await self._forget_deleted()
+            # numpy и файлы — в потоке, чтобы не держать event loop
+            meta = await asyncio.to_thread(self._prepare)
+        if self._view is None or self._view.meta != meta:
+            self._view = await asyncio.to_thread(IndexView, self.directory, meta)
+        self.refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # --- Одобрение ответов из истории (администратор) ---
+
+    async def candidates(self, limit: int) -> list[dict]:
+        """Свежие первые вопросы сессий с ответами AI, ещё не одобренные."""
+        approved = {doc["sid"] for doc in await asyncio.to_thread(read_approved, self.directory)}
+        return [
+            {"session_id": row.session_id, "question": row.question, "answer": row.answer}
+            for row in await _openers(limit)
+            if row.session_id not in approved
+        ]
+
+    async def approve(self, session_id: int) -> dict | None:
+        """
+        Добавляет в индекс первый вопрос сессии и ответ на него; None — такой
+        пары нет. Одобренных не больше RETRIEVAL_MAX_APPROVED: сверх лимита
+        вытесняются давно одобренные (повторное одобрение освежает), сразу
+        десятая часть — вытеснение пересобирает индекс, а так следующие
+        одобрения снова только дописываются.
+        """
+        rows = await _openers(1, session_id=session_id)
+        if not rows:
+            return None
+        doc = {"q": rows[0].question, "a": rows[0].answer, "src": "history", "sid": session_id}
+        key = normalize_query(doc["q"])
+        async with self._lock():
+            approved = await asyncio.to_thread(read_approved, self.directory)
+            approved = [d for d in approved if d["sid"] != session_id and normalize_query(d["q"]) != key]
+            approved.append(doc)
+            if len(approved) > RETRIEVAL_MAX_APPROVED:
+                approved = approved[-max(1, RETRIEVAL_MAX_APPROVED * 9 // 10):]
+            await asyncio.to_thread(_write_approved, self.directory, approved)
+        await self.refresh()
+        return doc
+
+    async def revoke(self, session_id: int) -> bool:
+        async with self._lock():
+            approved = await asyncio.to_thread(read_approved, self.directory)
+            kept = [d for d in approved if d["sid"] != session_id]
+            if len(kept) == len(approved):
+                return False
+            await asyncio.to_thread(_write_approved, self.directory, kept)
+        await self.refresh()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(RETRIEVAL_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("retrieval index refresh failed")
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("retrieval index unavailable, answering via AI only")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        view = self._view
+        return {
+            "docs": view.size if view else 0,
+            "nnz": view.meta["nnz"] if view else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "term_mismatches": self.term_mismatches,
+            "refresh_ms": self.refresh_ms,
+        }
+
+
+retrieval_index = RetrievalIndex(
+    RETRIEVAL_DIR,
+    Path(RETRIEVAL_FAQ_PATH) if RETRIEVAL_FAQ_PATH else FAQ_PATH,
+    RETRIEVAL_THRESHOLD,
+    enabled=RETRIEVAL_ENABLED,
+)
@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+from app import models
+from app.core.cache import TTLCache
+from app.core.config import AUTH_PRINCIPAL_CACHE_TTL, AUTH_PRINCIPAL_CACHE_SIZE
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Текущий пользователь без привязки к сессии БД — его можно кэшировать."""
+    id: int
+    username: str
+
+
+class PrincipalCache(TTLCache):
+    """
+    Кэш Principal по user_id. Сверх hits/misses считает, сколько
+    запросов к users удалось не делать (кэш + доверие claims).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(max_size, ttl)
+        self.lookups = 0
+        self.trusted_claims = 0
+
+    def stats(self) -> dict:
+        saved = self.hits + self.trusted_claims
+        return {
+            **super().stats(),
+            "lookups": self.lookups,
+            "trusted_claims": self.trusted_claims,
+            "db_queries_saved": saved,
+            "db_queries_saved_per_request": round(saved / self.lookups, 3) if self.lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(
+    max_size=AUTH_PRINCIPAL_CACHE_SIZE,
+    ttl=AUTH_PRINCIPAL_CACHE_TTL,
+)
+
+
+def invalidate_principal(user_id: int) -> None:
+    principal_cache.invalidate(user_id)
+
+
+# Любое изменение или удаление пользователя через ORM сбрасывает его запись
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_principal(target.id)
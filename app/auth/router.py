@@ -1,15 +1,19 @@
-from sqlalchemy import select
+import logging
+
+from sqlalchemy import delete, select
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
-from app.database import get_async_session
+from app.database import get_async_session, get_read_session
 from app import models
+from app.auth.cache import Principal, principal_cache, invalidate_principal
+from app.core.config import AUTH_TRUST_TOKEN_CLAIMS
 from app.schemas import UserCreate, UserLogin, Token
 from app.auth.utils import (
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_password_async,
     create_access_token,
     SECRET_KEY,
     ALGORITHM,
@@ -17,17 +21,16 @@ from app.auth.utils import (
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
+logger = logging.getLogger(__name__)
+
 bearer_scheme = HTTPBearer()
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    session: AsyncSession = Depends(get_async_session)
-) -> models.User:
-    print("TOKEN:", credentials.credentials)  # <- посмотри, что реально приходит
+def decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        print("PAYLOAD:", payload)
+        # Сам токен и payload не логируем: это учётные данные
+        logger.debug("token accepted for user %s", payload.get("sub"))
         user_id = payload.get("sub")
         if credentials is None:
             raise HTTPException(status_code=401, detail="Not authenticated")
@@ -35,21 +38,74 @@ async def get_current_user(
             raise HTTPException(status_code=401, detail="Invalid token")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+
+async def load_principal(user_id: int, session: AsyncSession) -> Principal:
+    """Principal из кэша, а при промахе — из таблицы users."""
+    principal_cache.lookups += 1
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
 
     result = await session.execute(
-        select(models.User).where(models.User.id == int(user_id))
+        select(models.User).where(models.User.id == user_id)
     )
     user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    print("USER:", user)
-    return user
+    logger.debug("principal loaded from DB: user %s", user.id)
+
+    principal = Principal(id=user.id, username=user.username)
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    session: AsyncSession = Depends(get_async_session)
+) -> Principal:
+    payload = decode_token(credentials)
+    return await load_principal(int(payload["sub"]), session)
+
+
+async def get_current_user_readonly(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    session: AsyncSession = Depends(get_read_session)
+) -> Principal:
+    """
+    Для read-only маршрутов. С AUTH_TRUST_TOKEN_CLAIMS=1 пользователь
+    берётся из подписанных claims токена без запроса к БД
+    (удалённый пользователь с живым токеном увидит только пустую историю).
+    """
+    payload = decode_token(credentials)
+    user_id = int(payload["sub"])
+    if AUTH_TRUST_TOKEN_CLAIMS and payload.get("username"):
+        principal_cache.lookups += 1
+        principal_cache.trusted_claims += 1
+        return Principal(id=user_id, username=payload["username"])
+    return await load_principal(user_id, session)
+
 
 @router.get("/me")
-async def me(current_user: models.User = Depends(get_current_user)):
+async def me(current_user: Principal = Depends(get_current_user)):
     return {"id": current_user.id, "username": current_user.username}
 
 
+# Удаление аккаунта: один DELETE, сессии, сообщения и архивы
+# удаляет БД (ON DELETE CASCADE)
+@router.delete("/me")
+async def delete_me(
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    await session.execute(delete(models.User).where(models.User.id == current_user.id))
+    await session.commit()
+    # Core-DELETE не вызывает ORM-событие after_delete — сбрасываем кэш сами
+    invalidate_principal(current_user.id)
+    return {"status": "deleted"}
+
+
 @router.post("/register", response_model=Token)
 async def register(
     user_data: UserCreate,
@@ -63,14 +119,18 @@ async def register(
     if existing:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed = hash_password(user_data.password)
+    # Отдаём соединение в пул, пока считается bcrypt
+    await session.close()
+    hashed = await hash_password_async(user_data.password)
 
     new_user = models.User(username=user_data.username, password_hash=hashed)
     session.add(new_user)
     await session.commit()
     await session.refresh(new_user)
+    # SQLite может переиспользовать id удалённого пользователя
+    invalidate_principal(new_user.id)
 
-    token = create_access_token({"sub": str(new_user.id)})
+    token = create_access_token({"sub": str(new_user.id), "username": new_user.username})
     return Token(access_token=token)
 
 
@@ -89,8 +149,10 @@ async def login(
 
     user = models.User(**row._mapping)
 
-    if not verify_password(user_data.password, user.password_hash):
+    # Отдаём соединение в пул, пока считается bcrypt
+    await session.close()
+    if not await verify_password_async(user_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token({"sub": str(user.id)})
+    token = create_access_token({"sub": str(user.id), "username": user.username})
     return Token(access_token=token)
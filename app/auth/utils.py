@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,12 +8,14 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 
+from app.core.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE
+
 # --- Настройки JWT и паролей ---
 SECRET_KEY = "supersecretkey123"  # позже лучше вынести в .env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 часа
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # --- Хешируем пароль ---
 def hash_password(password: str) -> str:
@@ -21,6 +25,48 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# --- bcrypt вне event loop ---
+# Хэш занимает сотни миллисекунд CPU, поэтому считаем его в отдельном
+# маленьком пуле потоков. Очередь к пулу ограничена: при переполнении
+# сразу отвечаем 503, а не копим логины.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+hash_rejections = 0
+
+
+async def _run_hashing(fn, *args):
+    global _hash_pending, hash_rejections
+    if _hash_pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        hash_rejections += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Слишком много входов одновременно, попробуйте позже",
+            headers={"Retry-After": "1"}
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+
+def password_hashing_stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": _hash_pending,
+        "queue_limit": PASSWORD_HASH_QUEUE,
+        "rejections": hash_rejections,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+    }
+
 # --- Генерируем JWT-токен ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
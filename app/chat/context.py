@@ -0,0 +1,125 @@
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import (
+    AI_CONTEXT_MAX_CHARS,
+    AI_CONTEXT_MAX_MESSAGES,
+    AI_SUMMARY_MAX_CHARS,
+    AI_SUMMARY_LINE_CHARS,
+)
+from app.models import Session, Message
+
+ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+OVERFLOW_BATCH = 500  # сколько выпавших из окна сообщений сворачивать за один SELECT
+
+
+def fold_into_summary(summary: str | None, messages) -> str:
+    """
+    Дописывает сообщения (от старых к новым) в свёрнутое содержание:
+    по строке на сообщение, длинные обрезаются. Если содержание вышло
+    за AI_SUMMARY_MAX_CHARS, отбрасываются самые старые строки.
+    """
+    lines = summary.splitlines() if summary else []
+    for m in messages:
+        text = " ".join(m.text.split())
+        if len(text) > AI_SUMMARY_LINE_CHARS:
+            text = text[:AI_SUMMARY_LINE_CHARS - 1] + "…"
+        lines.append(f"{ROLE_NAMES.get(m.role, m.role)}: {text}")
+
+    total = sum(len(line) + 1 for line in lines)
+    while len(lines) > 1 and total > AI_SUMMARY_MAX_CHARS:
+        total -= len(lines.pop(0)) + 1
+    return "\n".join(lines)
+
+
+async def fold_overflow(db: AsyncSession, session_obj: Session, oldest: Message) -> bool:
+    """
+    Сворачивает в summary все несвёрнутые сообщения старше oldest
+    (самого старого сообщения окна) пачками по OVERFLOW_BATCH, от старых
+    к новым, и сдвигает summary_message_id. False — сворачивать нечего.
+    """
+    def older_than(m: Message):
+        # Ключ сортировки берём из БД (см. crud._sessions_page)
+        anchor = select(Message.created_at).where(Message.id == m.id).scalar_subquery()
+        return tuple_(Message.created_at, Message.id) < tuple_(anchor, m.id)
+
+    def newer_than(m: Message):
+        anchor = select(Message.created_at).where(Message.id == m.id).scalar_subquery()
+        return tuple_(Message.created_at, Message.id) > tuple_(anchor, m.id)
+
+    query = (
+        select(Message)
+        .where(
+            Message.session_id == session_obj.id,
+            Message.id > (session_obj.summary_message_id or 0),
+            older_than(oldest),
+        )
+        .order_by(Message.created_at, Message.id)
+        .limit(OVERFLOW_BATCH)
+    )
+    folded, last = False, None
+    while True:
+        batch_query = query if last is None else query.where(newer_than(last))
+        batch = (await db.execute(batch_query)).scalars().all()
+        if not batch:
+            break
+        session_obj.summary = fold_into_summary(session_obj.summary, batch)
+        session_obj.summary_message_id = max(session_obj.summary_message_id or 0, *(m.id for m in batch))
+        folded, last = True, batch[-1]
+        if len(batch) < OVERFLOW_BATCH:
+            break
+    return folded
+
+
+async def build_context(db: AsyncSession, session_id: int, user_id: int) -> list[dict]:
+    """
+    Собирает history для AI: последние сообщения сессии в пределах
+    AI_CONTEXT_MAX_CHARS (не больше AI_CONTEXT_MAX_MESSAGES), а всё, что
+    из окна выпало, сворачивается в summary сессии. Содержание хранится
+    в sessions и пополняется на каждом ходе, поэтому ход читает одну строку
+    сессии и не больше AI_CONTEXT_MAX_MESSAGES сообщений, а не всю историю
+    (старый хвост дочитывается fold_overflow один раз).
+    Чужая или несуществующая сессия — 404.
+    """
+    result = await db.execute(
+        select(Session).where(Session.id == session_id, Session.user_id == user_id)
+    )
+    session_obj = result.scalar_one_or_none()
+    if not session_obj:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+
+    # Ещё не свёрнутые сообщения, новые первыми
+    result = await db.execute(
+        select(Message)
+        .where(
+            Message.session_id == session_id,
+            Message.id > (session_obj.summary_message_id or 0)
+        )
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(AI_CONTEXT_MAX_MESSAGES)
+    )
+    recent = result.scalars().all()
+
+    window, used = [], 0
+    for m in recent:
+        if window and used + len(m.text) > AI_CONTEXT_MAX_CHARS:
+            break
+        window.append(m)
+        used += len(m.text)
+
+    # Всё, что старше окна и ещё не свёрнуто, сворачиваем один раз и больше
+    # не читаем: и выпавшее по символам, и не попавшее в LIMIT
+    if window and (len(window) < len(recent) or len(recent) == AI_CONTEXT_MAX_MESSAGES):
+        if await fold_overflow(db, session_obj, window[-1]):
+            await db.commit()
+
+    history = []
+    if session_obj.summary:
+        history.append({
+            "role": "system",
+            "text": "Краткое содержание предыдущей части беседы:\n" + session_obj.summary
+        })
+    history += [{"role": m.role, "text": m.text} for m in reversed(window)]
+    return history
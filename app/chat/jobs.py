@@ -0,0 +1,411 @@
+"""
+Чат в режиме заданий: POST /api/v1/chat/jobs кладёт ход в очередь и сразу
+отвечает 202 с job_id, ответ AI получает пул воркеров, а клиент забирает
+результат через GET /api/v1/chat/jobs/{job_id} (с ?wait= — long-poll).
+Ни HTTP-соединение, ни сессия БД не держатся на время вызова AI:
+БД нужна только на чтение контекста и на запись хода.
+
+Очередь и воркеры — в процессе, принявшем задание, а статус и ответ
+пишутся в таблицу chat_jobs: под gunicorn с несколькими воркерами GET
+может попасть в другой процесс и прочитает задание оттуда.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.ai.client import ask_ai_assistant
+from app.ai.limiter import UpstreamBusy
+from app.auth.utils import get_current_user_id
+from app.chat.context import build_context
+from app.chat.ratelimit import chat_rate_limit
+from app.chat.router import AI_FALLBACK_ANSWER
+from app.core.config import (
+    CHAT_JOBS_WORKERS,
+    CHAT_JOBS_QUEUE_SIZE,
+    CHAT_JOBS_RESULT_TTL,
+    CHAT_JOBS_MAX_WAIT,
+    CHAT_JOBS_STALE_AFTER,
+)
+from app.database import AsyncSessionLocal, ReadSessionLocal, get_read_session
+from app.history.crud import get_session_version
+from app.history.writer import persist_turn
+from app.models import ChatJobRecord
+from app.schemas import ChatQueryRequest, ChatJobOut
+
+logger = logging.getLogger(__name__)
+
+BUSY_RETRIES = 3  # сколько раз воркер переждёт перегрузку upstream
+DEFER_DELAY = 0.2  # через сколько секунд проверить снова, свободна ли сессия
+POLL_INTERVAL = 0.25  # шаг long-poll по заданиям другого процесса
+PURGE_INTERVAL = 60.0  # как часто чистить chat_jobs
+
+FINISHED = ("done", "failed")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class ChatJob:
+    user_id: int
+    session_id: int
+    message: str
+    use_cache: bool
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    seq: int | None = None  # порядковый номер строки в chat_jobs
+    status: str = "queued"
+    answer: str | None = None
+    error: str | None = None
+    finished_at: float | None = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def out(self) -> ChatJobOut:
+        return ChatJobOut(job_id=self.id, status=self.status, answer=self.answer, error=self.error)
+
+
+def _record_out(record: ChatJobRecord) -> ChatJobOut:
+    return ChatJobOut(job_id=record.id, status=record.status, answer=record.answer, error=record.error)
+
+
+class ChatJobs:
+    """
+    Ограниченная очередь заданий и пул воркеров в этом же процессе.
+    Задания одной сессии выстраиваются в цепочку (каждый следующий ход
+    видит предыдущий в истории), а в общей очереди стоят сессии с
+    готовым к запуску заданием: воркер берёт сессию, выполняет одно её
+    задание и, если цепочка не пуста, ставит сессию в конец очереди.
+    Поэтому воркер никогда не ждёт чужой ход, а сессии разделяют пул
+    поровну. Готовые задания хранятся result_ttl секунд.
+
+    Ходы одной сессии, принятые разными процессами, упорядочивает
+    chat_jobs.seq: пока более ранний ход сессии не завершён (и не старше
+    stale_after), сессия возвращается в очередь через DEFER_DELAY.
+    """
+
+    def __init__(self, workers: int, max_queue: int, result_ttl: float, stale_after: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        # В очереди — id сессий; каждая не больше одного раза
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._chains: dict[int, deque[ChatJob]] = {}
+        self._queued = 0
+        self._jobs: dict[str, ChatJob] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._purged_at: float | None = None
+        self.submitted = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not t.done() for t in self._tasks)
+
+    async def start(self) -> None:
+        if not self.running:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дорабатывает уже принятые задания (не дольше timeout) и гасит воркеры."""
+        if not self._tasks:
+            return
+        # Очередь пуста только когда отработаны все цепочки: сессия
+        # возвращается в очередь до task_done своего предыдущего хода
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("chat jobs: %s jobs unfinished after %ss, cancelling", self._queued, timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Не доработанные задания завершаем ошибкой, чтобы long-poll не ждал зря
+        unfinished = [job for job in self._jobs.values() if job.status not in FINISHED]
+        for job in unfinished:
+            job.status, job.error = "failed", "Сервер остановлен"
+            job.finished_at = time.monotonic()
+            job.done.set()
+        if unfinished:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ChatJobRecord)
+                        .where(ChatJobRecord.id.in_([job.id for job in unfinished]))
+                        .values(status="failed", error="Сервер остановлен", finished_at=_utcnow())
+                    )
+                    await db.commit()
+            except Exception:
+                logger.exception("chat jobs: failed to mark unfinished jobs")
+        self._queue = asyncio.Queue()
+        self._chains.clear()
+        self._queued = 0
+
+    async def submit(self, job: ChatJob) -> None:
+        """Записывает задание в chat_jobs и ставит его в очередь процесса."""
+        self._expire()
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Очередь заданий переполнена, попробуйте позже",
+                headers={"Retry-After": "1"}
+            )
+        # Место в очереди занято до записи, чтобы параллельные submit его не превысили
+        self._queued += 1
+        try:
+            if self._purged_at is None or time.monotonic() - self._purged_at > PURGE_INTERVAL:
+                await self._purge()
+            async with AsyncSessionLocal() as db:
+                record = ChatJobRecord(id=job.id, user_id=job.user_id, session_id=job.session_id)
+                db.add(record)
+                await db.commit()
+                job.seq = record.seq
+        except BaseException:
+            self._queued -= 1
+            raise
+
+        chain = self._chains.get(job.session_id)
+        if chain is None:
+            self._chains[job.session_id] = deque([job])
+            self._queue.put_nowait(job.session_id)
+        else:
+            # Сессия уже в очереди или в работе: ход встанет за предыдущим
+            chain.append(job)
+        self._jobs[job.id] = job
+        self.submitted += 1
+
+    def get(self, job_id: str, user_id: int) -> ChatJob | None:
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.result_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    async def _purge(self) -> None:
+        """
+        Чистит chat_jobs: готовые задания старше result_ttl удаляются,
+        незавершённые старше stale_after (их процесс упал) — помечаются failed.
+        """
+        self._purged_at = time.monotonic()
+        now = _utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ChatJobRecord)
+                .where(
+                    ChatJobRecord.status.not_in(FINISHED),
+                    ChatJobRecord.created_at < now - timedelta(seconds=self.stale_after),
+                )
+                .values(status="failed", error="Задание потеряно", finished_at=now)
+            )
+            await db.execute(
+                delete(ChatJobRecord).where(ChatJobRecord.finished_at < now - timedelta(seconds=self.result_ttl))
+            )
+            await db.commit()
+
+    async def _blocked(self, job: ChatJob) -> bool:
+        """Есть ли у сессии более ранний незавершённый ход (его ведёт другой процесс)."""
+        async with ReadSessionLocal() as db:
+            earlier = await db.scalar(
+                select(ChatJobRecord.seq)
+                .where(
+                    ChatJobRecord.session_id == job.session_id,
+                    ChatJobRecord.seq < job.seq,
+                    ChatJobRecord.status.not_in(FINISHED),
+                    ChatJobRecord.created_at > _utcnow() - timedelta(seconds=self.stale_after),
+                )
+                .limit(1)
+            )
+        return earlier is not None
+
+    def _requeue_later(self, session_id: int) -> None:
+        # task_done — только вместе с возвратом в очередь: иначе join
+        # (и stop) решил бы, что всё отработано, пока сессия ждёт
+        queue = self._queue
+
+        def put() -> None:
+            queue.put_nowait(session_id)
+            queue.task_done()
+
+        asyncio.get_running_loop().call_later(DEFER_DELAY, put)
+
+    async def _save(self, job: ChatJob) -> None:
+        values = {"status": job.status, "answer": job.answer, "error": job.error}
+        if job.status in FINISHED:
+            values["finished_at"] = _utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(ChatJobRecord).where(ChatJobRecord.id == job.id).values(**values))
+            await db.commit()
+
+    async def _worker(self) -> None:
+        while True:
+            session_id = await self._queue.get()
+            chain = self._chains[session_id]
+            job = chain[0]
+            try:
+                blocked = await self._blocked(job)
+            except Exception:
+                logger.exception("chat job %s: order check failed", job.id)
+                blocked = False
+            if blocked:
+                self.deferred += 1
+                self._requeue_later(session_id)
+                continue
+
+            chain.popleft()
+            self._queued -= 1
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.exception("chat job %s failed", job.id)
+                job.status, job.error = "failed", str(e) or type(e).__name__
+                self.failed += 1
+            finally:
+                # Итог — в chat_jobs до запуска следующего хода сессии
+                try:
+                    await self._save(job)
+                except Exception:
+                    logger.exception("chat job %s: failed to store result", job.id)
+                job.finished_at = time.monotonic()
+                job.done.set()
+                # Следующий ход сессии — в конец очереди, за другими сессиями
+                if chain:
+                    self._queue.put_nowait(session_id)
+                else:
+                    del self._chains[session_id]
+                self._queue.task_done()
+
+    async def _run(self, job: ChatJob) -> None:
+        job.status = "running"
+        await self._save(job)
+
+        # 1. Короткое чтение: контекст беседы
+        async with AsyncSessionLocal() as db:
+            history = await build_context(db, job.session_id, job.user_id)
+
+        # 2. AI — без соединения с БД; перегрузку upstream пережидаем
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                ai_response = await ask_ai_assistant(
+                    query=job.message,
+                    session_id=str(job.session_id),
+                    history=history,
+                    use_cache=job.use_cache
+                )
+                break
+            except UpstreamBusy as e:
+                if attempt == BUSY_RETRIES:
+                    raise
+                await asyncio.sleep(e.retry_after)
+            except Exception:
+                ai_response = {"answer": AI_FALLBACK_ANSWER}
+                break
+
+        # 3. Короткая запись хода; при write-behind дожидаемся её —
+        # следующее задание сессии строит контекст сразу после этого
+        async with AsyncSessionLocal() as db:
+            await persist_turn(db, job.session_id, job.message, ai_response["answer"], wait=True)
+
+        job.answer = ai_response["answer"]
+        job.status = "done"
+        self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queued,
+            "sessions": len(self._chains),
+            "tracked": len(self._jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "deferred": self.deferred,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+chat_jobs = ChatJobs(CHAT_JOBS_WORKERS, CHAT_JOBS_QUEUE_SIZE, CHAT_JOBS_RESULT_TTL, CHAT_JOBS_STALE_AFTER)
+
+
+# ======================================================
+#                      ЭНДПОИНТЫ
+# ======================================================
+
+router = APIRouter(prefix="/api/v1/chat/jobs", tags=["Chat"])
+
+
+@router.post("", response_model=ChatJobOut, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    payload: ChatQueryRequest,
+    response: Response,
+    user_id: int = Depends(chat_rate_limit),
+    db: AsyncSession = Depends(get_read_session),
+):
+    # Чужая сессия — 404 сразу, а не в результате задания
+    if await get_session_version(db, payload.session_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    await db.close()
+
+    job = ChatJob(
+        user_id=user_id,
+        session_id=payload.session_id,
+        message=payload.message,
+        use_cache=payload.use_cache,
+    )
+    await chat_jobs.submit(job)
+    response.headers["Location"] = f"{router.prefix}/{job.id}"
+    return job.out()
+
+
+async def read_job(job_id: str, user_id: int, wait: float = 0) -> ChatJobOut | None:
+    """
+    Задание, принятое другим процессом: статус из chat_jobs. С wait —
+    опрос раз в POLL_INTERVAL, пока задание не завершится или не выйдет время.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        async with ReadSessionLocal() as db:
+            record = await db.scalar(
+                select(ChatJobRecord).where(ChatJobRecord.id == job_id, ChatJobRecord.user_id == user_id)
+            )
+        if record is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if record.status in FINISHED or remaining <= 0:
+            return _record_out(record)
+        await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+
+@router.get("/{job_id}", response_model=ChatJobOut)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="сколько секунд ждать готовности (long-poll)"),
+    user_id: int = Depends(get_current_user_id),
+):
+    wait = min(wait, CHAT_JOBS_MAX_WAIT)
+    job = chat_jobs.get(job_id, user_id)
+    if job is None:
+        out = await read_job(job_id, user_id, wait)
+        if out is None:
+            raise HTTPException(status_code=404, detail="Задание не найдено")
+        return out
+    if wait and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+    return job.out()
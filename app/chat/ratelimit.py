@@ -0,0 +1,71 @@
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, status
+
+from app.auth.utils import get_current_user_id
+from app.core.config import CHAT_RATE_PER_MINUTE, CHAT_RATE_BURST, CHAT_RATE_MAX_USERS
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket на пользователя: ведро на burst запросов пополняется
+    со скоростью rate в секунду. Пополнение считается лениво при обращении,
+    фоновых задач нет. Давно не заходившие пользователи вытесняются
+    (их ведро всё равно было бы полным).
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_users: int):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_users = max_users
+        self._buckets: OrderedDict[int, list[float]] = OrderedDict()  # user_id -> [tokens, ts]
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, user_id: int) -> float:
+        """0 — запрос пропущен, иначе через сколько секунд появится токен."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [float(self.burst), now]
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket[0]) / self.rate
+
+    def stats(self) -> dict:
+        return {
+            "per_minute": self.rate * 60,
+            "burst": self.burst,
+            "users": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+chat_rate_limiter = TokenBucketLimiter(CHAT_RATE_PER_MINUTE, CHAT_RATE_BURST, CHAT_RATE_MAX_USERS)
+
+
+# --- Dependency: пользователь из токена + проверка его лимита ---
+def chat_rate_limit(user_id: int = Depends(get_current_user_id)) -> int:
+    wait = chat_rate_limiter.acquire(user_id)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов, попробуйте позже",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    return user_id
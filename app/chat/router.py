@@ -1,48 +1,146 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import ChatQueryRequest, ChatQueryResponse
 from app.database import get_async_session
-from app.history.crud import get_messages_by_session, save_message
-from app.ai.client import ask_ai_assistant
-from app.auth.utils import get_current_user_id
+from app.chat.context import build_context
+from app.history.writer import persist_turn, persist_turn_detached
+from app.ai.client import (
+    ask_ai_assistant,
+    stream_ai_assistant,
+    get_cached_answer,
+    cache_answer,
+)
+from app.ai.limiter import UpstreamBusy, upstream_limiter
+from app.chat.ratelimit import chat_rate_limit
 
 router = APIRouter(prefix="/api/v1/chat", tags=["Chat"])
 
+AI_FALLBACK_ANSWER = "AI-ассистент временно недоступен. Попробуйте позже."
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def upstream_busy(e: UpstreamBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="AI-ассистент перегружен, попробуйте позже",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 
 @router.post("/query", response_model=ChatQueryResponse)
 async def query_ai(
     payload: ChatQueryRequest,
-    user_id: int = Depends(get_current_user_id),
+    user_id: int = Depends(chat_rate_limit),
     session: AsyncSession = Depends(get_async_session),
     ):
-    # 1. Загружаем историю
-    await get_messages_by_session(
-        session,
-        session_id=payload.session_id,
-        user_id=user_id
-    )
+    # 1. Собираем контекст: свёрнутое содержание + последние сообщения
+    history = await build_context(session, payload.session_id, user_id)
 
     # 2. Вызываем AI
     try:
         ai_response = await ask_ai_assistant(
             query=payload.message,
             session_id=str(payload.session_id),
-            history=history
+            history=history,
+            use_cache=payload.use_cache
         )
+    except UpstreamBusy as e:
+        # Перегрузка — не ошибка AI: ход не сохраняем, клиент повторит
+        raise upstream_busy(e)
     except Exception as e:
         # fallback
         ai_response = {
-            "answer": "AI-ассистент временно недоступен. Попробуйте позже.",
+            "answer": AI_FALLBACK_ANSWER,
             "tokens_used": 0,
             "category": "error"
         }
 
     answer_text = ai_response["answer"]
 
-    # 3. Сохраняем сообщения
-    await save_message(session, payload.session_id, "user", payload.message)
-    await save_message(session, payload.session_id, "assistant", answer_text)
+    # 3. Сохраняем сообщения (одной транзакцией или через write-behind)
+    await persist_turn(session, payload.session_id, payload.message, answer_text)
 
     # 4. Возвращаем фронту
     return ChatQueryResponse(answer=answer_text)
+
+
+@router.post("/stream")
+async def stream_ai(
+    payload: ChatQueryRequest,
+    user_id: int = Depends(chat_rate_limit),
+    session: AsyncSession = Depends(get_async_session),
+    ):
+    """
+    То же, что /query, но ответ AI уходит клиенту кусками (Server-Sent Events):
+    `event: chunk` с полем delta по мере генерации и `event: done` с полным
+    ответом после того, как он сохранён в историю.
+    """
+    # 1. Собираем контекст (до старта потока, пока жива сессия из Depends)
+    history = await build_context(session, payload.session_id, user_id)
+
+    # После первого байта статус уже не поменять: перегрузку проверяем заранее
+    cached = await get_cached_answer(payload.message, history) if payload.use_cache else None
+    if cached is None:
+        try:
+            upstream_limiter.check()
+        except UpstreamBusy as e:
+            raise upstream_busy(e)
+
+    async def events():
+        parts = []
+        persisted = False
+        try:
+            # Сразу отдаём первый байт, не дожидаясь AI
+            yield ": stream-open\n\n"
+
+            # 2. Ретранслируем куски ответа (из кэша — одним куском)
+            if cached is not None:
+                parts.append(cached["answer"])
+                yield sse_event("chunk", {"delta": cached["answer"]})
+            else:
+                try:
+                    async for delta in stream_ai_assistant(
+                        query=payload.message,
+                        session_id=str(payload.session_id),
+                        history=history
+                    ):
+                        parts.append(delta)
+                        yield sse_event("chunk", {"delta": delta})
+                    cache_answer(payload.message, history, {"answer": "".join(parts)})
+                except Exception:
+                    if not parts:
+                        parts = [AI_FALLBACK_ANSWER]
+                        yield sse_event("chunk", {"delta": AI_FALLBACK_ANSWER})
+                    yield sse_event("error", {"detail": "AI stream interrupted"})
+
+            answer_text = "".join(parts)
+
+            # 3. Сохраняем сообщения своей короткой сессией:
+            #    сессия из Depends к этому моменту может быть уже закрыта
+            persisted = True
+            await persist_turn_detached(payload.session_id, payload.message, answer_text)
+
+            # 4. Сообщаем, что ответ завершён
+            yield sse_event("done", {"answer": answer_text})
+        finally:
+            # Клиент отключился посреди ответа: ход сохраняем с тем, что успели получить
+            if not persisted:
+                await persist_turn_detached(
+                    payload.session_id, payload.message, "".join(parts) or AI_FALLBACK_ANSWER
+                )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,283 @@
+"""
+WebSocket-канал чата: /api/v1/chat/ws.
+
+Токен проверяется один раз на соединение, контекст каждой сессии
+читается из БД при первом обращении и дальше живёт в памяти соединения,
+поэтому ход стоит одну запись в БД и вызов AI. По одному сокету можно
+вести несколько сессий: ходы разных сессий идут параллельно, одной —
+по очереди.
+
+Протокол (JSON-кадры):
+    -> {"type": "auth", "token": "<JWT>"}          (или ?token= в URL)
+    <- {"type": "ready", "user_id": 1}
+    -> {"type": "message", "session_id": 5, "message": "...", "id": "c1", "use_cache": true}
+    <- {"type": "chunk", "session_id": 5, "id": "c1", "delta": "..."}   (много раз)
+    <- {"type": "done",  "session_id": 5, "id": "c1", "answer": "..."}
+    <- {"type": "error", "session_id": 5, "id": "c1", "detail": "...", "retry_after": 3}
+    -> {"type": "forget", "session_id": 5}   — выбросить контекст из памяти
+    -> {"type": "ping"}  <- {"type": "pong"}
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from jose import JWTError, jwt
+
+from app.ai.client import stream_ai_assistant, get_cached_answer, cache_answer
+from app.ai.limiter import UpstreamBusy, upstream_limiter
+from app.auth.router import load_principal
+from app.auth.utils import SECRET_KEY, ALGORITHM
+from app.chat.context import build_context, fold_into_summary
+from app.chat.ratelimit import chat_rate_limiter
+from app.chat.router import AI_FALLBACK_ANSWER
+from app.core.config import (
+    AI_CONTEXT_MAX_CHARS,
+    AI_CONTEXT_MAX_MESSAGES,
+    WS_AUTH_TIMEOUT,
+    WS_MAX_SESSIONS,
+)
+from app.database import AsyncSessionLocal
+from app.history.writer import persist_turn_detached
+
+router = APIRouter(prefix="/api/v1/chat", tags=["Chat"])
+
+logger = logging.getLogger(__name__)
+
+# Коды закрытия 4000+ — прикладные; 4401 — «не авторизован»
+WS_UNAUTHORIZED = 4401
+
+SUMMARY_PREFIX = "Краткое содержание предыдущей части беседы:\n"
+
+
+class Conversation:
+    """
+    Контекст одной сессии в памяти соединения: свёрнутое содержание
+    и окно последних сообщений в тех же пределах, что и build_context.
+    Изменения другим клиентом в ту же сессию сюда не попадают до
+    переподключения (или кадра forget).
+    """
+
+    def __init__(self, history: list[dict]):
+        self.summary = None
+        if history and history[0]["role"] == "system":
+            self.summary = history[0]["text"].removeprefix(SUMMARY_PREFIX)
+            history = history[1:]
+        self.window = list(history)
+        self.lock = asyncio.Lock()
+
+    def history(self) -> list[dict]:
+        head = [{"role": "system", "text": SUMMARY_PREFIX + self.summary}] if self.summary else []
+        return head + self.window
+
+    def append(self, user_text: str, assistant_text: str) -> None:
+        self.window += [
+            {"role": "user", "text": user_text},
+            {"role": "assistant", "text": assistant_text},
+        ]
+        # Старые сообщения сверх бюджета сворачиваем, как build_context
+        dropped = []
+        used = sum(len(m["text"]) for m in self.window)
+        while len(self.window) > 1 and (
+            len(self.window) > AI_CONTEXT_MAX_MESSAGES or used > AI_CONTEXT_MAX_CHARS
+        ):
+            m = self.window.pop(0)
+            used -= len(m["text"])
+            dropped.append(SimpleNamespace(**m))
+        if dropped:
+            self.summary = fold_into_summary(self.summary, dropped)
+
+
+class ChatConnection:
+    def __init__(self, websocket: WebSocket, user_id: int, token_exp: float | None):
+        self.ws = websocket
+        self.user_id = user_id
+        self.token_exp = token_exp
+        self.conversations: OrderedDict[int, Conversation] = OrderedDict()
+        self._send_lock = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def send(self, frame: dict) -> None:
+        # Кадры разных сессий пишутся из разных задач — по одному
+        async with self._send_lock:
+            await self.ws.send_json(frame)
+
+    async def conversation(self, session_id: int) -> Conversation:
+        conv = self.conversations.get(session_id)
+        if conv is not None:
+            self.conversations.move_to_end(session_id)
+            return conv
+        # Единственное чтение БД для сессии за время соединения
+        async with AsyncSessionLocal() as db:
+            history = await build_context(db, session_id, self.user_id)
+        conv = self.conversations.setdefault(session_id, Conversation(history))
+        while len(self.conversations) > WS_MAX_SESSIONS:
+            self.conversations.popitem(last=False)
+        return conv
+
+    def spawn(self, frame: dict) -> None:
+        task = asyncio.create_task(self._guarded(frame))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _guarded(self, frame: dict) -> None:
+        try:
+            await self.handle_message(frame)
+        except (asyncio.CancelledError, WebSocketDisconnect):
+            raise
+        except Exception:
+            logger.exception("websocket turn failed for user %s", self.user_id)
+            try:
+                await self.send({
+                    "type": "error",
+                    "session_id": frame.get("session_id"),
+                    "id": frame.get("id"),
+                    "detail": "Внутренняя ошибка",
+                })
+            except Exception:
+                pass
+
+    async def handle_message(self, frame: dict) -> None:
+        session_id = frame.get("session_id")
+        message = frame.get("message")
+        ref = {"session_id": session_id, "id": frame.get("id")}
+        if not isinstance(session_id, int) or not isinstance(message, str) or not message:
+            await self.send({"type": "error", **ref, "detail": "Нужны session_id и message"})
+            return
+
+        wait = chat_rate_limiter.acquire(self.user_id)
+        if wait:
+            await self.send({
+                "type": "error", **ref,
+                "detail": "Слишком много запросов, попробуйте позже",
+                "retry_after": max(1, round(wait)),
+            })
+            return
+
+        try:
+            conv = await self.conversation(session_id)
+        except HTTPException as e:
+            await self.send({"type": "error", **ref, "detail": e.detail})
+            return
+
+        async with conv.lock:
+            history = conv.history()
+            use_cache = frame.get("use_cache", True)
+            cached = await get_cached_answer(message, history) if use_cache else None
+
+            if cached is None:
+                try:
+                    upstream_limiter.check()
+                except UpstreamBusy as e:
+                    await self.send({
+                        "type": "error", **ref,
+                        "detail": "AI-ассистент перегружен, попробуйте позже",
+                        "retry_after": e.retry_after,
+                    })
+                    return
+
+            parts = []
+            persisted = False
+            try:
+                if cached is not None:
+                    parts.append(cached["answer"])
+                    await self.send({"type": "chunk", **ref, "delta": cached["answer"]})
+                else:
+                    try:
+                        async for delta in stream_ai_assistant(
+                            query=message,
+                            session_id=str(session_id),
+                            history=history
+                        ):
+                            parts.append(delta)
+                            await self.send({"type": "chunk", **ref, "delta": delta})
+                        cache_answer(message, history, {"answer": "".join(parts)})
+                    except Exception:
+                        if not parts:
+                            parts = [AI_FALLBACK_ANSWER]
+                            await self.send({"type": "chunk", **ref, "delta": AI_FALLBACK_ANSWER})
+                        await self.send({"type": "error", **ref, "detail": "AI stream interrupted"})
+
+                answer_text = "".join(parts)
+                persisted = True
+                await persist_turn_detached(session_id, message, answer_text)
+                conv.append(message, answer_text)
+            finally:
+                # Соединение закрылось посреди ответа (задачу хода отменили):
+                # ход сохраняем с тем, что успели получить
+                if not persisted:
+                    await persist_turn_detached(session_id, message, "".join(parts) or AI_FALLBACK_ANSWER)
+
+        await self.send({"type": "done", **ref, "answer": answer_text})
+
+
+def authenticate(token: str | None) -> tuple[int, float | None]:
+    if not token:
+        raise ValueError("Not authenticated")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise ValueError("Invalid token")
+    if not payload.get("sub"):
+        raise ValueError("Invalid token")
+    return int(payload["sub"]), payload.get("exp")
+
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    await websocket.accept()
+
+    # 1. Авторизация — один раз на соединение
+    token = websocket.query_params.get("token")
+    try:
+        if token is None:
+            frame = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+            token = frame.get("token") if frame.get("type") == "auth" else None
+        user_id, token_exp = authenticate(token)
+        async with AsyncSessionLocal() as db:
+            await load_principal(user_id, db)
+    except (ValueError, HTTPException, asyncio.TimeoutError) as e:
+        reason = getattr(e, "detail", None) or str(e) or "Not authenticated"
+        await websocket.close(code=WS_UNAUTHORIZED, reason=reason)
+        return
+    except WebSocketDisconnect:
+        return
+
+    conn = ChatConnection(websocket, user_id, token_exp)
+    await conn.send({"type": "ready", "user_id": user_id})
+    logger.debug("websocket opened for user %s", user_id)
+
+    # 2. Кадры клиента; ходы выполняются в отдельных задачах
+    try:
+        while True:
+            try:
+                frame = await websocket.receive_json()
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                await conn.send({"type": "error", "detail": "Ожидался JSON-объект"})
+                continue
+            if conn.token_exp is not None and time.time() >= conn.token_exp:
+                await websocket.close(code=WS_UNAUTHORIZED, reason="Token expired")
+                break
+            kind = frame.get("type")
+            if kind == "message":
+                conn.spawn(frame)
+            elif kind == "forget":
+                conn.conversations.pop(frame.get("session_id"), None)
+            elif kind == "ping":
+                await conn.send({"type": "pong"})
+            else:
+                await conn.send({"type": "error", "detail": f"Неизвестный тип кадра: {kind!r}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await conn.close()
+        logger.debug("websocket closed for user %s", user_id)
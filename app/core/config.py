@@ -6,3 +6,135 @@ AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", 35.0))
 
 if not AI_BASE_URL or not AI_API_KEY:
     raise RuntimeError("AI_BASE_URL или AI_API_KEY не заданы в окружении")
+
+# --- Таймауты по фазам (по умолчанию — общий AI_TIMEOUT) ---
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", 5.0))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", AI_TIMEOUT))
+AI_WRITE_TIMEOUT = float(os.getenv("AI_WRITE_TIMEOUT", 10.0))
+AI_POOL_TIMEOUT = float(os.getenv("AI_POOL_TIMEOUT", 5.0))
+
+# --- Пул соединений к AI ---
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", 100))
+AI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", 20))
+AI_KEEPALIVE_EXPIRY = float(os.getenv("AI_KEEPALIVE_EXPIRY", 30.0))
+AI_HTTP2 = os.getenv("AI_HTTP2", "0") == "1"
+
+# --- Кэш ответов AI (0 — выключен) ---
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", 3600.0))
+AI_CACHE_MAX_SIZE = int(os.getenv("AI_CACHE_MAX_SIZE", 1024))
+
+# --- Запись истории: write-behind с групповым коммитом (по умолчанию выключен) ---
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "0") == "1"
+HISTORY_WRITE_QUEUE_SIZE = int(os.getenv("HISTORY_WRITE_QUEUE_SIZE", 1000))
+HISTORY_WRITE_BATCH_SIZE = int(os.getenv("HISTORY_WRITE_BATCH_SIZE", 200))
+HISTORY_WRITE_INTERVAL = float(os.getenv("HISTORY_WRITE_INTERVAL", 0.05))
+
+# --- Кэш аутентифицированных пользователей ---
+AUTH_PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", 60.0))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", 10000))
+# 1 — read-only маршруты верят подписанным claims токена и не ходят в БД
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "0") == "1"
+
+# --- Хэширование паролей ---
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+# Сколько хэширований может ждать свободного потока, сверх — 503
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 32))
+
+# --- Контекст беседы для AI ---
+AI_CONTEXT_MAX_CHARS = int(os.getenv("AI_CONTEXT_MAX_CHARS", 6000))
+AI_CONTEXT_MAX_MESSAGES = int(os.getenv("AI_CONTEXT_MAX_MESSAGES", 20))
+AI_SUMMARY_MAX_CHARS = int(os.getenv("AI_SUMMARY_MAX_CHARS", 2000))
+AI_SUMMARY_LINE_CHARS = int(os.getenv("AI_SUMMARY_LINE_CHARS", 200))
+
+# --- Логи ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Уровни по логгерам: "app.auth=DEBUG,sqlalchemy.engine=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Доля записей ниже WARNING, которые пишутся: "app.access=0.1"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# --- HTTP ---
+# Ответы короче этого (байт) не сжимаются: gzip на них только тратит CPU
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", 1024))
+
+# --- Архив истории ---
+# Сессии без новых сообщений дольше стольких дней уходят в архив
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 100))
+# Токен для служебных эндпоинтов (заголовок X-Admin-Token); пусто — выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# --- Допуск к чату ---
+# Token bucket на пользователя: сколько запросов в минуту и какой всплеск
+# можно сделать разом. 0 — без ограничения.
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", 30))
+CHAT_RATE_BURST = int(os.getenv("CHAT_RATE_BURST", 5))
+CHAT_RATE_MAX_USERS = int(os.getenv("CHAT_RATE_MAX_USERS", 100000))
+# Одновременных вызовов AI на процесс и сколько запросов может ждать слота
+AI_MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", 32))
+AI_QUEUE_SIZE = int(os.getenv("AI_QUEUE_SIZE", 64))
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", 2.0))
+
+# --- Устойчивость к сбоям AI ---
+# Circuit breaker: за последние AI_BREAKER_WINDOW секунд не меньше
+# AI_BREAKER_MIN_CALLS вызовов и доля ошибок >= AI_BREAKER_FAILURE_RATE —
+# цепь размыкается на AI_BREAKER_OPEN_SECONDS, потом пробные вызовы
+AI_BREAKER_WINDOW = float(os.getenv("AI_BREAKER_WINDOW", 30.0))
+AI_BREAKER_MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", 10))
+AI_BREAKER_FAILURE_RATE = float(os.getenv("AI_BREAKER_FAILURE_RATE", 0.5))
+AI_BREAKER_OPEN_SECONDS = float(os.getenv("AI_BREAKER_OPEN_SECONDS", 15.0))
+AI_BREAKER_HALF_OPEN_PROBES = int(os.getenv("AI_BREAKER_HALF_OPEN_PROBES", 1))
+# Повторы при ошибках соединения и 502/503/504: сколько дополнительных
+# попыток и база/потолок экспоненциальной паузы (со случайным jitter)
+AI_RETRIES = int(os.getenv("AI_RETRIES", 1))
+AI_RETRY_BACKOFF = float(os.getenv("AI_RETRY_BACKOFF", 0.1))
+AI_RETRY_BACKOFF_MAX = float(os.getenv("AI_RETRY_BACKOFF_MAX", 1.0))
+# Hedging: если ответа нет дольше этого перцентиля недавних латентностей,
+# параллельно отправляется второй запрос. 0 — выключено.
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", 0))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", 50))
+
+# --- Чат в режиме заданий (POST /api/v1/chat/jobs) ---
+CHAT_JOBS_WORKERS = int(os.getenv("CHAT_JOBS_WORKERS", 16))
+CHAT_JOBS_QUEUE_SIZE = int(os.getenv("CHAT_JOBS_QUEUE_SIZE", 1000))
+# Сколько секунд хранить результат готового задания
+CHAT_JOBS_RESULT_TTL = float(os.getenv("CHAT_JOBS_RESULT_TTL", 600.0))
+# Потолок ожидания в long-poll GET ?wait=
+CHAT_JOBS_MAX_WAIT = float(os.getenv("CHAT_JOBS_MAX_WAIT", 30.0))
+# Незавершённое задание старше этого считается потерянным (процесс упал):
+# оно больше не задерживает следующие ходы сессии и помечается failed
+CHAT_JOBS_STALE_AFTER = float(os.getenv("CHAT_JOBS_STALE_AFTER", 900.0))
+
+# --- WebSocket-чат ---
+# Сколько секунд ждать сообщения auth после подключения
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", 10.0))
+# Сколько сессий чата держать в памяти на одно соединение (LRU)
+WS_MAX_SESSIONS = int(os.getenv("WS_MAX_SESSIONS", 16))
+
+# --- Старт приложения: схема БД ---
+# migrate — alembic upgrade head (новая БД: create_all + stamp head);
+# create_all — создать недостающие таблицы, не меняя существующие (разработка;
+#   БД с ревизией ниже head не запустится — её нужно мигрировать);
+# check — только сверить ревизию с head и не стартовать при расхождении;
+# none — ничего не делать (схемой управляет деплой)
+DB_INIT_MODE = os.getenv("DB_INIT_MODE", "migrate")
+# Файловая блокировка: DDL выполняет один процесс, остальные воркеры ждут
+DB_INIT_LOCK_FILE = os.getenv("DB_INIT_LOCK_FILE", ".db_init.lock")
+
+# --- Локальные ответы по FAQ (app/ai/retrieval.py) ---
+# Выключено по умолчанию: включать после проверки на своих вопросах
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "0") == "1"
+# Каталог индекса (общий для всех воркеров, файлы читаются через mmap)
+RETRIEVAL_DIR = os.getenv("RETRIEVAL_DIR", "./retrieval_index")
+# Свой файл FAQ вместо встроенного app/ai/faq.json
+RETRIEVAL_FAQ_PATH = os.getenv("RETRIEVAL_FAQ_PATH", "")
+# Минимальное косинусное сходство вопроса с вопросом из индекса (вдобавок
+# к совпадению ключевых терминов); подобрано по размеченным вопросам
+# в tests/test_retrieval.py — при смене порога прогоните их
+RETRIEVAL_THRESHOLD = float(os.getenv("RETRIEVAL_THRESHOLD", 0.45))
+# Как часто перечитывать индекс и убирать ответы удалённых сессий, сек
+RETRIEVAL_REFRESH_INTERVAL = float(os.getenv("RETRIEVAL_REFRESH_INTERVAL", 60.0))
+# Сколько одобренных ответов из истории держать в индексе (вытесняются давние)
+RETRIEVAL_MAX_APPROVED = int(os.getenv("RETRIEVAL_MAX_APPROVED", 5000))
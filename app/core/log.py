@@ -0,0 +1,184 @@
+"""
+Структурные (JSON) логи без блокировок event loop: обработчик только
+кладёт запись в ограниченную очередь, в stdout пишет фоновый поток
+QueueListener. Полная очередь — запись отбрасывается и считается.
+Выключенный DEBUG ничего не стоит: logger.debug("...%s", x) отсекается
+проверкой уровня до форматирования.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import LOG_LEVEL, LOG_LEVELS, LOG_SAMPLING, LOG_QUEUE_SIZE
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def parse_mapping(value: str) -> dict[str, str]:
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip(): v.strip() for k, v in pairs}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            data["request_id"] = record.request_id
+        # Всё, что передано через extra=...
+        for key, value in record.__dict__.items():
+            if key not in _STD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Ставит request_id в потоке вызова и никогда не ждёт места в очереди."""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        # Аргументы и traceback превращаем в строки здесь: объекты
+        # из запроса не должны уезжать в другой поток
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей ниже WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+_listener: QueueListener | None = None
+
+
+def setup_logging() -> None:
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener)
+
+    root = logging.getLogger()
+    root.handlers = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL.upper())
+
+    # httpx пишет INFO на каждый запрос к AI — на горячем пути это лишнее
+    levels = {"httpx": "WARNING", "httpcore": "WARNING", **parse_mapping(LOG_LEVELS)}
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in parse_mapping(LOG_SAMPLING).items():
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+
+
+def _restart_listener() -> None:
+    # После fork (gunicorn с preload_app) фоновый поток остался в родителе,
+    # а унаследованная очередь будит только его — заводим новую очередь и поток
+    if _listener is not None:
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, QueueHandler):
+                handler.queue = log_queue
+        _listener.queue = log_queue
+        _listener._thread = None
+        _listener.start()
+
+
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает фоновый поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# ======================================================
+#        request_id + access-лог (чистый ASGI)
+# ======================================================
+
+access_logger = logging.getLogger("app.access")
+
+
+class RequestContextMiddleware:
+    """
+    Берёт X-Request-ID из запроса (или генерирует), кладёт его в контекст
+    логов и возвращает в ответе; пишет одну access-запись на запрос.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %s", scope["method"], scope["path"], status_holder[0],
+                    extra={"duration_ms": round((time.perf_counter() - started) * 1000, 3)},
+                )
+            request_id_var.reset(token)
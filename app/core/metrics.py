@@ -0,0 +1,214 @@
+"""
+Метрики в формате Prometheus без внешних зависимостей.
+На горячем пути — только perf_counter, bisect и сложение в словаре;
+всё, что можно посчитать при скрейпе (пулы БД, кэши), считается там.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (+Inf последняя), сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        names = self.label_names + ("le",)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class CallbackMetric:
+    """Значения вычисляются при скрейпе: fn() -> [(значения меток, число), ...]."""
+
+    def __init__(self, name: str, help: str, type: str, labels: tuple[str, ...], fn: Callable):
+        self.name, self.help, self.type, self.label_names, self.fn = name, help, type, labels, fn
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.fn():
+            yield f"{self.name}{_labels(self.label_names, tuple(labels))} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template",
+    labels=("method", "route", "status"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served",
+))
+
+# --- БД ---
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements", buckets=DB_BUCKETS,
+))
+db_queries_per_request = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request",
+    labels=("route",), buckets=COUNT_BUCKETS,
+))
+db_time_per_request = registry.register(Histogram(
+    "http_request_db_seconds", "Total SQL time per HTTP request",
+    labels=("route",), buckets=DB_BUCKETS,
+))
+
+# --- AI upstream ---
+ai_upstream_duration = registry.register(Histogram(
+    "ai_upstream_duration_seconds", "Latency of AI upstream calls",
+    labels=("mode", "outcome"),
+))
+ai_upstream_requests = registry.register(Counter(
+    "ai_upstream_requests_total", "AI upstream calls by HTTP status (or error class)",
+    labels=("mode", "status"),
+))
+
+
+# ======================================================
+#           SQL: количество и время на запрос
+# ======================================================
+
+# [число запросов, суммарное время] текущего HTTP-запроса
+_request_db: ContextVar[list | None] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(sync_engine) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_query_duration.observe(elapsed)
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def pool_metrics(engines: dict) -> CallbackMetric:
+    def collect():
+        for name, eng in engines.items():
+            pool = eng.sync_engine.pool
+            if hasattr(pool, "checkedout"):
+                yield (name, "checked_out"), pool.checkedout()
+                yield (name, "idle"), pool.checkedin()
+                yield (name, "overflow"), pool.overflow()
+    return CallbackMetric("db_pool_connections", "DB pool connections by state", "gauge", ("engine", "state"), collect)
+
+
+# ======================================================
+#                 ASGI middleware
+# ======================================================
+
+class MetricsMiddleware:
+    """Чистый ASGI (без BaseHTTPMiddleware), чтобы не ломать стриминг и не тратить лишнего."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        db_stats = [0, 0.0]
+        token = _request_db.set(db_stats)
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            _request_db.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            http_request_duration.observe(elapsed, scope["method"], template, status_holder[0])
+            db_queries_per_request.observe(db_stats[0], template)
+            db_time_per_request.observe(db_stats[1], template)
@@ -0,0 +1,161 @@
+"""
+Подготовка схемы БД при старте приложения (режим — DB_INIT_MODE).
+
+Несколько воркеров uvicorn/gunicorn стартуют одновременно и раньше
+каждый гонял create_all по одному файлу SQLite. Теперь DDL выполняется
+под файловой блокировкой: первый процесс создаёт/мигрирует схему,
+остальные дожидаются его и видят уже готовую ревизию.
+
+С preload (gunicorn.conf.py) схему готовит мастер до fork,
+а воркеры по флагу _ready пропускают этот шаг.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+
+from app import models
+from app.core.config import DB_INIT_MODE, DB_INIT_LOCK_FILE
+from app.database import engine, DATABASE_URL, close_engines
+
+try:
+    import fcntl
+except ImportError:  # Windows: один процесс разработки, блокировка не нужна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+DB_INIT_MODES = ("create_all", "migrate", "check", "none")
+
+_ready = False
+
+
+def alembic_config() -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+    # Не даём env.py перенастроить логирование приложения через fileConfig
+    config.attributes["configure_logger"] = False
+    return config
+
+
+@contextlib.asynccontextmanager
+async def file_lock(path: str):
+    """Межпроцессная блокировка по файлу path (ожидание — в потоке, не в loop)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _db_state(connection) -> tuple[set[str], bool]:
+    """Текущие ревизии alembic и есть ли в БД таблицы приложения."""
+    revisions = set(MigrationContext.configure(connection).get_current_heads())
+    has_tables = bool(set(inspect(connection).get_table_names()) & set(models.Base.metadata.tables))
+    return revisions, has_tables
+
+
+async def _current_state() -> tuple[set[str], bool]:
+    async with engine.connect() as conn:
+        return await conn.run_sync(_db_state)
+
+
+async def _create_all() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+
+async def _create_missing(heads: set[str]) -> None:
+    """
+    create_all не добавляет колонки в существующие таблицы: на БД со старой
+    ревизией он «пройдёт», а запросы упадут (no such column). Такую БД не
+    трогаем, новую — создаём и отмечаем head, чтобы потом работал migrate.
+    """
+    revisions, has_tables = await _current_state()
+    if revisions and revisions != heads:
+        raise RuntimeError(
+            f"Ревизия БД {','.join(sorted(revisions))} ниже head {','.join(sorted(heads))}: "
+            "create_all её не обновит — запустите с DB_INIT_MODE=migrate или выполните alembic upgrade head"
+        )
+    await _create_all()
+    if not revisions and not has_tables:
+        await asyncio.to_thread(command.stamp, alembic_config(), "head")
+
+
+async def _migrate(heads: set[str]) -> None:
+    config = alembic_config()
+    revisions, has_tables = await _current_state()
+    if revisions == heads:
+        return
+    # alembic и env.py синхронные (со своим asyncio.run) — выполняем в потоке
+    if not revisions and not has_tables:
+        logger.info("empty database: create_all and stamp %s", ",".join(sorted(heads)))
+        await _create_all()
+        await asyncio.to_thread(command.stamp, config, "head")
+    elif not revisions:
+        raise RuntimeError(
+            "В БД есть таблицы, но нет ревизии alembic: "
+            "отметьте её вручную (alembic stamp <revision>) и перезапустите"
+        )
+    else:
+        logger.info("migrating database %s -> %s", ",".join(sorted(revisions)), ",".join(sorted(heads)))
+        await asyncio.to_thread(command.upgrade, config, "head")
+
+
+async def init_database(mode: str = DB_INIT_MODE) -> None:
+    """Приводит схему БД в порядок согласно mode (см. DB_INIT_MODE)."""
+    global _ready
+    if mode not in DB_INIT_MODES:
+        raise RuntimeError(f"DB_INIT_MODE={mode!r}: ожидалось одно из {', '.join(DB_INIT_MODES)}")
+    if _ready or mode == "none":
+        return
+
+    started = time.perf_counter()
+    if mode == "check":
+        heads = set(ScriptDirectory.from_config(alembic_config()).get_heads())
+        revisions, _ = await _current_state()
+        if revisions != heads:
+            raise RuntimeError(
+                f"Ревизия БД {','.join(sorted(revisions)) or '-'} не совпадает с head "
+                f"{','.join(sorted(heads))}: выполните alembic upgrade head"
+            )
+    else:
+        heads = set(ScriptDirectory.from_config(alembic_config()).get_heads())
+        async with file_lock(DB_INIT_LOCK_FILE):
+            if mode == "migrate":
+                await _migrate(heads)
+            else:
+                await _create_missing(heads)
+
+    _ready = True
+    logger.info(
+        "database ready (mode=%s, pid=%s) in %.1f ms",
+        mode, os.getpid(), (time.perf_counter() - started) * 1000,
+    )
+
+
+def prepare_database(mode: str = DB_INIT_MODE) -> None:
+    """
+    Синхронная подготовка схемы до fork (мастер gunicorn с preload_app).
+    Соединения, открытые здесь, закрываются: после fork их нельзя делить.
+    """
+    async def run():
+        try:
+            await init_database(mode)
+        finally:
+            await close_engines()
+
+    asyncio.run(run())
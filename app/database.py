@@ -1,16 +1,92 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
 # --- Настройки БД ---
-DATABASE_URL = "sqlite+aiosqlite:///./app.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./app.db")
+# Отдельная БД для чтения (реплика); для SQLite по умолчанию тот же файл
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 10))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30.0))
+
+# --- Профиль SQLite ---
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 65536))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+        # В SQLite внешние ключи (и ON DELETE CASCADE) по умолчанию выключены
+        "PRAGMA foreign_keys = ON",
+    ]
+    if read_only:
+        # journal_mode хранится в самом файле, его выставляет пишущий движок
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        pragmas += [
+            f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}",
+            f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}",
+        ]
+    return pragmas
+
+
+def _apply_pragmas(engine, read_only: bool = False) -> None:
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
 
 # --- Создаём async engine ---
 engine = create_async_engine(
     DATABASE_URL,
     future=True,
-    echo=False
+    echo=False,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
 )
 
+# --- Движок только для чтения ---
+# В WAL читатели не ждут писателя, а отдельный пул не даёт GET-запросам
+# стоять в очереди за соединениями, занятыми записью.
+if IS_SQLITE or DATABASE_READ_URL != DATABASE_URL:
+    read_engine = create_async_engine(
+        DATABASE_READ_URL,
+        future=True,
+        echo=False,
+        pool_size=DB_READ_POOL_SIZE,
+        max_overflow=DB_READ_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+else:
+    read_engine = engine
+
+if IS_SQLITE:
+    _apply_pragmas(engine)
+    if read_engine is not engine:
+        _apply_pragmas(read_engine, read_only=True)
+
 # --- Создаём async sessionmaker ---
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -18,10 +94,28 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
 # --- Dependency для FastAPI ---
 async def get_async_session():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+# --- Dependency для read-only маршрутов (GET истории) ---
+async def get_read_session():
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+async def close_engines() -> None:
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
@@ -0,0 +1,269 @@
+"""
+Архив холодной истории: сообщения сессий, в которых давно не было
+активности, переезжают из messages в message_archives — одним
+zlib-сжатым JSON на сессию. Горячая таблица, её индексы и FTS
+остаются маленькими, а чтение истории распаковывает архив прозрачно
+(crud.get_messages_by_session). Текст архива остаётся в поиске:
+он переносится в отдельный индекс archive_fts (см. models.py).
+
+Запуск: python -m app.history.archive --days 90 [--vacuum]
+или POST /admin/archive с заголовком X-Admin-Token.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.chat.context import fold_into_summary
+from app.core.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from app.database import AsyncSessionLocal, engine, IS_SQLITE
+from app.models import Session, Message, MessageArchive
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 120
+
+# Итоги последнего прогона (для GET /stats)
+last_run: dict = {}
+
+
+# --- Формат blob: zlib(JSON [[id, role, text, created_at], ...]) ---
+
+def pack(messages: list[Message]) -> tuple[bytes, int]:
+    raw = json.dumps(
+        [[m.id, m.role, m.text, m.created_at.isoformat() if m.created_at else None] for m in messages],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return zlib.compress(raw, 9), len(raw)
+
+
+def unpack(data: bytes, session_id: int) -> list[Message]:
+    """Распакованные сообщения — transient-объекты Message (в сессию не добавляются)."""
+    return [
+        Message(
+            id=msg_id,
+            session_id=session_id,
+            role=role,
+            text=body,
+            created_at=datetime.fromisoformat(created_at) if created_at else None,
+        )
+        for msg_id, role, body, created_at in json.loads(zlib.decompress(data))
+    ]
+
+
+async def get_archived_messages(db: AsyncSession, session_id: int, user_id: int) -> list[Message]:
+    """Архивная часть сессии в хронологическом порядке ([] — архива нет или сессия чужая)."""
+    result = await db.execute(
+        select(MessageArchive.data)
+        .join(Session, Session.id == MessageArchive.session_id)
+        .where(MessageArchive.session_id == session_id, Session.user_id == user_id)
+    )
+    data = result.scalar_one_or_none()
+    return unpack(data, session_id) if data is not None else []
+
+
+# ======================================================
+#                   АРХИВАЦИЯ
+# ======================================================
+
+_ARCHIVE_FTS_INSERT = text(
+    "INSERT INTO archive_fts(rowid, text, sid, role, created_at) "
+    "VALUES (:id, :text, :sid, :role, :created_at)"
+)
+
+
+def _fts_rows(messages: list[Message]) -> list[dict]:
+    return [
+        {
+            "id": m.id,
+            "text": m.text.replace("ё", "е").replace("Ё", "Е"),
+            "sid": str(m.session_id),
+            "role": m.role,
+            "created_at": m.created_at.isoformat(sep=" ") if m.created_at else None,
+        }
+        for m in messages
+    ]
+
+
+async def archive_session(db: AsyncSession, session_id: int) -> dict:
+    """
+    Переносит все сообщения сессии из messages в её архив (дописывая
+    к уже заархивированным) одной транзакцией. Ещё не свёрнутые сообщения
+    сначала попадают в summary, чтобы продолжение беседы не потеряло контекст.
+    """
+    session_obj = await db.get(Session, session_id)
+    result = await db.execute(
+        select(Message)
+        .where(Message.session_id == session_id)
+        .order_by(Message.created_at, Message.id)
+    )
+    hot = result.scalars().all()
+    if session_obj is None or not hot:
+        return {"messages": 0, "raw_bytes": 0, "compressed_bytes": 0}
+
+    archive = await db.get(MessageArchive, session_id)
+    old_raw, old_compressed = (archive.raw_bytes, len(archive.data)) if archive else (0, 0)
+    messages = (unpack(archive.data, session_id) if archive else []) + list(hot)
+    data, raw_bytes = pack(messages)
+
+    if archive is None:
+        archive = MessageArchive(session_id=session_id)
+        db.add(archive)
+    archive.data = data
+    archive.message_count = len(messages)
+    archive.raw_bytes = raw_bytes
+    archive.last_message_at = messages[-1].created_at
+    archive.last_message_preview = messages[-1].text[:PREVIEW_CHARS]
+    archive.archived_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    unfolded = [m for m in hot if m.id > (session_obj.summary_message_id or 0)]
+    if unfolded:
+        session_obj.summary = fold_into_summary(session_obj.summary, unfolded)
+        session_obj.summary_message_id = max(m.id for m in unfolded)
+
+    # Текст — в индекс архива до удаления из messages (и из messages_fts)
+    if IS_SQLITE:
+        await db.execute(_ARCHIVE_FTS_INSERT, _fts_rows(hot))
+    await db.execute(delete(Message).where(Message.id.in_([m.id for m in hot])))
+    await db.commit()
+    return {
+        "messages": len(hot),
+        "raw_bytes": raw_bytes - old_raw,
+        "compressed_bytes": len(data) - old_compressed,
+    }
+
+
+async def _db_pages(db: AsyncSession) -> dict:
+    if not IS_SQLITE:
+        return {}
+    page_size = (await db.execute(text("PRAGMA page_size"))).scalar()
+    page_count = (await db.execute(text("PRAGMA page_count"))).scalar()
+    freelist = (await db.execute(text("PRAGMA freelist_count"))).scalar()
+    return {"file_bytes": page_size * page_count, "free_bytes": page_size * freelist}
+
+
+async def archive_totals(db: AsyncSession) -> dict:
+    result = await db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(MessageArchive.message_count), 0),
+            func.coalesce(func.sum(MessageArchive.raw_bytes), 0),
+            func.coalesce(func.sum(func.length(MessageArchive.data)), 0),
+        )
+    )
+    sessions, messages, raw, compressed = result.one()
+    return {
+        "sessions": sessions,
+        "messages": messages,
+        "raw_bytes": raw,
+        "compressed_bytes": compressed,
+    }
+
+
+async def run_archive(
+    days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    vacuum: bool = False
+) -> dict:
+    """
+    Архивирует все сессии, где последнее сообщение старше days дней.
+    Каждая сессия — своя короткая транзакция, чтобы не держать
+    блокировку записи. Возвращает статистику прогона и освобождённого места.
+    """
+    global last_run
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    stats = {"sessions": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0, "failed": 0}
+    skipped: set[int] = set()  # не выбирать повторно: ошибка или сессии уже нет
+
+    async with AsyncSessionLocal() as db:
+        before = await _db_pages(db)
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            candidates = select(Message.session_id).group_by(Message.session_id).having(
+                func.max(Message.created_at) < cutoff
+            )
+            if skipped:
+                candidates = candidates.where(Message.session_id.notin_(skipped))
+            session_ids = (await db.execute(candidates.limit(batch_size))).scalars().all()
+        if not session_ids:
+            break
+
+        for session_id in session_ids:
+            async with AsyncSessionLocal() as db:
+                try:
+                    moved = await archive_session(db, session_id)
+                except Exception:
+                    logger.exception("archiving session %s failed", session_id)
+                    await db.rollback()
+                    skipped.add(session_id)
+                    stats["failed"] += 1
+                    continue
+            if not moved["messages"]:
+                skipped.add(session_id)
+                continue
+            stats["sessions"] += 1
+            for key in ("messages", "raw_bytes", "compressed_bytes"):
+                stats[key] += moved[key]
+
+    if vacuum and IS_SQLITE:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql("VACUUM")
+
+    async with AsyncSessionLocal() as db:
+        after = await _db_pages(db)
+        stats["archive"] = await archive_totals(db)
+
+    if stats["raw_bytes"]:
+        stats["ratio"] = round(stats["compressed_bytes"] / stats["raw_bytes"], 3)
+    if before:
+        stats["db_before"], stats["db_after"] = before, after
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    last_run = stats
+    logger.info(
+        "archived %s messages from %s sessions (%s -> %s bytes)",
+        stats["messages"], stats["sessions"], stats["raw_bytes"], stats["compressed_bytes"],
+    )
+    return stats
+
+
+def archive_stats() -> dict:
+    return {k: v for k, v in last_run.items() if isinstance(v, (int, float))}
+
+
+# ======================================================
+#                       CLI
+# ======================================================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Архивация неактивных сессий")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="сколько дней без сообщений (по умолчанию ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true",
+                        help="после архивации сжать файл SQLite (VACUUM)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    async def run():
+        try:
+            return await run_archive(args.days, args.batch, args.vacuum)
+        finally:
+            await engine.dispose()
+
+    print(json.dumps(asyncio.run(run()), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
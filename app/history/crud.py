@@ -1,25 +1,98 @@
-from sqlalchemy import select
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import delete, insert, select, tuple_, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import Session, Message
+from sqlalchemy.orm import aliased
+from app.models import User, Session, Message, MessageArchive
+from app.history.archive import get_archived_messages
+
+PREVIEW_CHARS = 120
 
 
 # Создать новую сессию
 async def create_session(db: AsyncSession, user_id: int, title: str | None = None) -> Session:
     new_session = Session(user_id=user_id, title=title)
     db.add(new_session)
+    await bump_versions(db, user_ids=[user_id])
     await db.commit()
     await db.refresh(new_session)
     return new_session
 
 
-# Получить все сессии пользователя
-async def get_sessions(db: AsyncSession, user_id: int):
-    result = await db.execute(
-        select(Session).where(Session.user_id == user_id).order_by(Session.created_at.desc())
-    )
+# Получить сессии пользователя (новые первыми).
+# Keyset-пагинация: cursor — id последней сессии предыдущей страницы,
+# дальше идут строки строго «после» неё по (created_at, id).
+# Ключ сортировки берётся подзапросом из самой БД, поэтому сравнение
+# не зависит от того, в каком формате SQLite хранит дату.
+# Запрос идёт по индексу (user_id, created_at).
+def _sessions_page(query, user_id: int, limit: int | None, cursor: int | None):
+    query = query.where(Session.user_id == user_id)
+    if cursor is not None:
+        anchor = select(Session.created_at).where(Session.id == cursor).scalar_subquery()
+        query = query.where(tuple_(Session.created_at, Session.id) < tuple_(anchor, cursor))
+    query = query.order_by(Session.created_at.desc(), Session.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def get_sessions(
+    db: AsyncSession,
+    user_id: int,
+    limit: int | None = None,
+    cursor: int | None = None
+):
+    result = await db.execute(_sessions_page(select(Session), user_id, limit, cursor))
     return result.scalars().all()
 
 
+# То же + число сообщений, время и начало последнего сообщения — одним SQL.
+# Подзапросы коррелированы по строке страницы и оба идут по индексу
+# (session_id, created_at): count — по покрывающему индексу,
+# последнее сообщение — один seek с конца. Заархивированная часть
+# учитывается по сводным полям архива, без распаковки.
+async def get_sessions_with_stats(
+    db: AsyncSession,
+    user_id: int,
+    limit: int | None = None,
+    cursor: int | None = None
+) -> list[dict]:
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.session_id == Session.id)
+        .correlate(Session)
+        .scalar_subquery()
+    )
+    last_message_id = (
+        select(Message.id)
+        .where(Message.session_id == Session.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .correlate(Session)
+        .scalar_subquery()
+    )
+    last = aliased(Message)
+    query = (
+        select(
+            Session.id,
+            Session.title,
+            Session.created_at,
+            (message_count + func.coalesce(MessageArchive.message_count, 0)).label("message_count"),
+            func.coalesce(last.created_at, MessageArchive.last_message_at).label("last_message_at"),
+            func.coalesce(
+                func.substr(last.text, 1, PREVIEW_CHARS),
+                MessageArchive.last_message_preview
+            ).label("last_message_preview"),
+        )
+        .select_from(Session)
+        .outerjoin(last, last.id == last_message_id)
+        .outerjoin(MessageArchive, MessageArchive.session_id == Session.id)
+    )
+    result = await db.execute(_sessions_page(query, user_id, limit, cursor))
+    return [dict(row._mapping) for row in result]
+
+
 # Получить одну сессию
 async def get_session(db: AsyncSession, session_id: int) -> Session | None:
     result = await db.execute(
@@ -33,6 +106,7 @@ async def rename_session(db: AsyncSession, session_id: int, new_title: str):
     session = await get_session(db, session_id)
     if session:
         session.title = new_title
+        await bump_versions(db, session_ids=[session_id])
         await db.commit()
         return session
     return None
@@ -42,35 +116,144 @@ async def rename_session(db: AsyncSession, session_id: int, new_title: str):
 async def delete_session(db: AsyncSession, session_id: int):
     session = await get_session(db, session_id)
     if session:
-        await db.delete(session)
-        await db.commit()
-        return True
+        return await delete_sessions(db, session.user_id, session_ids=[session_id]) > 0
     return False
 
 
+# Удалить сессии пользователя одним DELETE: по списку id и/или все,
+# созданные раньше older_than. Сообщения и архивы удаляет сама БД
+# (ON DELETE CASCADE), в память ничего не загружается.
+# Возвращает число удалённых сессий.
+async def delete_sessions(
+    db: AsyncSession,
+    user_id: int,
+    session_ids: Iterable[int] | None = None,
+    older_than: datetime | None = None
+) -> int:
+    query = delete(Session).where(Session.user_id == user_id)
+    if session_ids is not None:
+        query = query.where(Session.id.in_(list(session_ids)))
+    if older_than is not None:
+        query = query.where(Session.created_at < older_than)
+    result = await db.execute(query.execution_options(synchronize_session=False))
+    if result.rowcount:
+        await bump_versions(db, user_ids=[user_id])
+    await db.commit()
+    return result.rowcount
+
+
 # ============ МЕССЕДЖИ ============
 
 async def save_message(db: AsyncSession, session_id: int, role: str, text: str):
     msg = Message(session_id=session_id, role=role, text=text)
     db.add(msg)
+    await bump_versions(db, session_ids=[session_id])
     await db.commit()
     await db.refresh(msg)
     return msg
 
 
+# Пачка сообщений [{"session_id", "role", "text"}, ...] одной транзакцией:
+# один executemany-INSERT, один commit, без refresh (плюс два UPDATE версий).
+async def save_messages(db: AsyncSession, messages: list[dict]) -> None:
+    if not messages:
+        return
+    await db.execute(insert(Message), messages)
+    await bump_versions(db, session_ids={m["session_id"] for m in messages})
+    await db.commit()
+
+
+# Сообщения сессии в хронологическом порядке.
+# cursor — id последнего сообщения предыдущей страницы (см. get_sessions),
+# запрос идёт по индексу (session_id, created_at).
+# Если у сессии есть архив (app/history/archive.py), его сообщения — самые
+# старые и идут первыми; горячие читаются только после них.
 async def get_messages_by_session(
     db: AsyncSession,
     session_id: int,
-    user_id: int
+    user_id: int,
+    limit: int | None = None,
+    cursor: int | None = None
 ):
-    result = await db.execute(
+    archived = await get_archived_messages(db, session_id, user_id)
+    if archived:
+        if cursor is not None:
+            pos = next((i for i, m in enumerate(archived) if m.id == cursor), None)
+            if pos is None:
+                archived = []  # курсор уже в горячей части
+            else:
+                archived, cursor = archived[pos + 1:], None
+        if limit is not None:
+            archived = archived[:limit]
+            limit -= len(archived)
+            if limit == 0:
+                return archived
+
+    query = (
         select(Message)
         .join(Session, Session.id == Message.session_id)
         .where(
             Message.session_id == session_id,
             Session.user_id == user_id
         )
-        .order_by(Message.created_at.asc())
     )
-    return result.scalars().all()
+    if cursor is not None:
+        anchor = select(Message.created_at).where(Message.id == cursor).scalar_subquery()
+        query = query.where(tuple_(Message.created_at, Message.id) > tuple_(anchor, cursor))
+    query = query.order_by(Message.created_at.asc(), Message.id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+    return archived + list(result.scalars().all())
+
+
+def next_cursor(rows, limit: int) -> int | None:
+    """Страницу запрашивают с limit + 1: лишняя строка значит, что есть продолжение."""
+    if len(rows) > limit:
+        return rows[limit - 1].id
+    return None
+
+
+# ============ ВЕРСИИ (ETag) ============
 
+# Любая запись в историю увеличивает счётчики: sessions.version —
+# у затронутых сессий, users.history_version — у их владельцев.
+# Коммит — на вызывающем, в той же транзакции, что и сами изменения.
+async def bump_versions(
+    db: AsyncSession,
+    session_ids: Iterable[int] = (),
+    user_ids: Iterable[int] = ()
+) -> None:
+    session_ids, user_ids = list(session_ids), set(user_ids)
+    if session_ids:
+        await db.execute(
+            update(Session)
+            .where(Session.id.in_(session_ids))
+            .values(version=Session.version + 1)
+        )
+        owners = select(Session.user_id).where(Session.id.in_(session_ids))
+        await db.execute(
+            update(User)
+            .where(User.id.in_(owners) | User.id.in_(user_ids))
+            .values(history_version=User.history_version + 1)
+        )
+    elif user_ids:
+        await db.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(history_version=User.history_version + 1)
+        )
+
+
+async def get_history_version(db: AsyncSession, user_id: int) -> int | None:
+    result = await db.execute(select(User.history_version).where(User.id == user_id))
+    return result.scalar_one_or_none()
+
+
+# None — сессии нет или она чужая
+async def get_session_version(db: AsyncSession, session_id: int, user_id: int) -> int | None:
+    result = await db.execute(
+        select(Session.version).where(Session.id == session_id, Session.user_id == user_id)
+    )
+    return result.scalar_one_or_none()
@@ -0,0 +1,331 @@
+"""
+Выгрузка всей истории пользователя (NDJSON / CSV) и обратная загрузка.
+Выгрузка читает БД серверным курсором и отдаёт строки по мере чтения,
+загрузка разбирает тело запроса потоком и пишет пачками, поэтому
+память не зависит от объёма истории.
+"""
+import codecs
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import ReadSessionLocal
+from app.history.archive import get_archived_messages
+from app.history.crud import bump_versions
+from app.models import Session, Message, MessageArchive
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+EXPORT_YIELD_PER = 500      # строк из курсора за одну выборку
+EXPORT_FLUSH_BYTES = 64 * 1024  # отдаём клиенту кусками примерно такого размера
+IMPORT_CHUNK_SIZE = 1000    # строк в одной транзакции загрузки
+
+CSV_COLUMNS = [
+    "session_id", "session_title", "session_created_at",
+    "message_id", "role", "text", "message_created_at",
+]
+
+
+def _iso(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+def _parse_dt(value: str | None) -> datetime:
+    # Без даты в файле — текущее время, как server_default (UTC без tzinfo)
+    if not value:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    return datetime.fromisoformat(value)
+
+
+# ======================================================
+#                      ВЫГРУЗКА
+# ======================================================
+
+def _export_query(user_id: int):
+    # Сессии с их сообщениями одним проходом: внешний цикл по индексу
+    # (user_id, created_at), внутренний — по (session_id, created_at),
+    # так что ORDER BY не требует сортировки всего результата.
+    # LEFT JOIN — чтобы пустые сессии тоже попали в выгрузку.
+    # archived — есть ли у сессии архив (сам blob читается отдельно, один раз).
+    return (
+        select(
+            Session.id.label("session_id"),
+            Session.title.label("session_title"),
+            Session.created_at.label("session_created_at"),
+            Message.id.label("message_id"),
+            Message.role,
+            Message.text,
+            Message.created_at.label("message_created_at"),
+            MessageArchive.session_id.label("archived"),
+        )
+        .select_from(Session)
+        .outerjoin(Message, Message.session_id == Session.id)
+        .outerjoin(MessageArchive, MessageArchive.session_id == Session.id)
+        .where(Session.user_id == user_id)
+        .order_by(Session.created_at, Session.id, Message.created_at, Message.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+
+
+async def _with_archived(db: AsyncSession, user_id: int, rows):
+    """Строки выгрузки, где перед горячими сообщениями сессии вставлены архивные."""
+    current = None
+    async for row in rows:
+        if row.session_id != current:
+            current = row.session_id
+            archived = []
+            if row.archived is not None:
+                archived = await get_archived_messages(db, row.session_id, user_id)
+            for m in archived:
+                yield SimpleNamespace(**{
+                    **row._asdict(),
+                    "message_id": m.id,
+                    "role": m.role,
+                    "text": m.text,
+                    "message_created_at": m.created_at,
+                })
+            if archived and row.message_id is None:
+                continue
+        yield row
+
+
+def _ndjson_lines(rows) -> AsyncIterator[str]:
+    async def lines():
+        current = None
+        async for row in rows:
+            if row.session_id != current:
+                current = row.session_id
+                yield json.dumps({
+                    "type": "session",
+                    "id": row.session_id,
+                    "title": row.session_title,
+                    "created_at": _iso(row.session_created_at),
+                }, ensure_ascii=False) + "\n"
+            if row.message_id is not None:
+                yield json.dumps({
+                    "type": "message",
+                    "id": row.message_id,
+                    "session_id": row.session_id,
+                    "role": row.role,
+                    "text": row.text,
+                    "created_at": _iso(row.message_created_at),
+                }, ensure_ascii=False) + "\n"
+    return lines()
+
+
+def _csv_lines(rows) -> AsyncIterator[str]:
+    async def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        async for row in rows:
+            writer.writerow([
+                row.session_id, row.session_title, _iso(row.session_created_at),
+                row.message_id, row.role, row.text, _iso(row.message_created_at),
+            ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    return lines()
+
+
+async def export_history(user_id: int, fmt: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Генератор тела ответа. Сессию БД открывает сам: зависимости FastAPI
+    закрываются до того, как StreamingResponse начнёт отдавать тело.
+    compress=True — gzip на лету (один поток, без буферизации целиком).
+    """
+    gz = zlib.compressobj(wbits=31) if compress else None
+    pending: list[bytes] = []
+    size = 0
+
+    async with ReadSessionLocal() as db:
+        rows = _with_archived(db, user_id, await db.stream(_export_query(user_id)))
+        lines = _ndjson_lines(rows) if fmt == "ndjson" else _csv_lines(rows)
+        async for line in lines:
+            data = line.encode("utf-8")
+            if gz is not None:
+                data = gz.compress(data)
+            if data:
+                pending.append(data)
+                size += len(data)
+            if size >= EXPORT_FLUSH_BYTES:
+                yield b"".join(pending)
+                pending, size = [], 0
+
+    if gz is not None:
+        pending.append(gz.flush())
+    if pending:
+        yield b"".join(pending)
+
+
+# ======================================================
+#                      ЗАГРУЗКА
+# ======================================================
+
+class HistoryImportError(ValueError):
+    """Ошибка в строке загружаемого файла (номер строки — в тексте)."""
+
+
+async def _decoded_lines(body: AsyncIterator[bytes], gzipped: bool) -> AsyncIterator[str]:
+    """Тело запроса -> строки (с переводом строки на конце), без чтения целиком."""
+    gz = zlib.decompressobj(wbits=31) if gzipped else None
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in body:
+        if gz is not None:
+            chunk = gz.decompress(chunk)
+        *complete, tail = (tail + utf8.decode(chunk)).split("\n")
+        for line in complete:
+            yield line + "\n"
+    if gz is not None:
+        tail += utf8.decode(gz.flush())
+    tail += utf8.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict]]:
+    lineno = 0
+    async for line in lines:
+        lineno += 1
+        if not line.strip():
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HistoryImportError(f"строка {lineno}: некорректный JSON ({e.msg})")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict]]:
+    # Поле в кавычках может содержать перевод строки: копим физические строки,
+    # пока число кавычек не станет чётным, — тогда запись закончена.
+    lineno = 0
+    record: list[str] = []
+    quotes = 0
+    header = None
+    seen_sessions: set = set()
+    async for line in lines:
+        lineno += 1
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        values = next(csv.reader(["".join(record)]), [])
+        record, quotes = [], 0
+        if not values:
+            continue
+        if header is None:
+            header = values
+            if header != CSV_COLUMNS:
+                raise HistoryImportError(f"строка {lineno}: ожидался заголовок {','.join(CSV_COLUMNS)}")
+            continue
+        row = dict(zip(header, values))
+        if row["session_id"] not in seen_sessions:
+            seen_sessions.add(row["session_id"])
+            yield lineno, {
+                "type": "session",
+                "id": row["session_id"],
+                "title": row["session_title"] or None,
+                "created_at": row["session_created_at"],
+            }
+        if row["message_id"]:
+            yield lineno, {
+                "type": "message",
+                "session_id": row["session_id"],
+                "role": row["role"],
+                "text": row["text"],
+                "created_at": row["message_created_at"],
+            }
+    if record:
+        raise HistoryImportError(f"строка {lineno}: незакрытая кавычка")
+
+
+async def import_history(
+    db: AsyncSession,
+    user_id: int,
+    body: AsyncIterator[bytes],
+    fmt: str,
+    gzipped: bool = False,
+) -> dict:
+    """
+    Загружает выгрузку export_history в аккаунт user_id.
+    Сессии получают новые id (старые сопоставляются по ходу файла),
+    даты сохраняются. Пишет пачками по IMPORT_CHUNK_SIZE строк,
+    каждая пачка — отдельная транзакция: блокировка записи держится
+    недолго, а при ошибке в файле уже загруженные пачки остаются.
+    """
+    lines = _decoded_lines(body, gzipped)
+    records = _ndjson_records(lines) if fmt == "ndjson" else _csv_records(lines)
+
+    session_ids: dict[str, int] = {}  # id из файла -> новый id
+    sessions: dict[str, dict] = {}  # id из файла -> строка для INSERT (ещё не записаны)
+    messages: list[tuple[int, dict]] = []
+    stats = {"sessions": 0, "messages": 0}
+
+    async def flush():
+        if sessions:
+            # RETURNING в порядке параметров — сопоставляем старые id с новыми
+            result = await db.execute(
+                insert(Session).returning(Session.id, sort_by_parameter_order=True),
+                list(sessions.values()),
+            )
+            for old_id, new_id in zip(sessions, result.scalars()):
+                session_ids[old_id] = new_id
+            stats["sessions"] += len(sessions)
+        rows = []
+        for lineno, msg in messages:
+            new_id = session_ids.get(msg.pop("old_session_id"))
+            if new_id is None:
+                raise HistoryImportError(f"строка {lineno}: сообщение ссылается на неизвестную сессию")
+            rows.append({**msg, "session_id": new_id})
+        if rows:
+            await db.execute(insert(Message), rows)
+            stats["messages"] += len(rows)
+        if sessions or rows:
+            await bump_versions(db, user_ids=[user_id])
+        await db.commit()
+        sessions.clear()
+        messages.clear()
+
+    async for lineno, rec in records:
+        try:
+            kind = rec.get("type")
+            if kind == "session":
+                old_id = str(rec["id"])
+                if old_id in session_ids or old_id in sessions:
+                    raise HistoryImportError(f"строка {lineno}: сессия {old_id} встречается дважды")
+                sessions[old_id] = {
+                    "user_id": user_id,
+                    "title": rec.get("title"),
+                    "created_at": _parse_dt(rec.get("created_at")),
+                }
+            elif kind == "message":
+                if rec.get("role") not in ("user", "assistant") or not isinstance(rec.get("text"), str):
+                    raise HistoryImportError(f"строка {lineno}: у сообщения нет role/text")
+                messages.append((lineno, {
+                    "old_session_id": str(rec["session_id"]),
+                    "role": rec["role"],
+                    "text": rec["text"],
+                    "created_at": _parse_dt(rec.get("created_at")),
+                }))
+            else:
+                raise HistoryImportError(f"строка {lineno}: неизвестный тип записи {kind!r}")
+        except HistoryImportError:
+            raise
+        except (KeyError, TypeError, ValueError) as e:
+            raise HistoryImportError(f"строка {lineno}: {e!r}")
+
+        if len(sessions) + len(messages) >= IMPORT_CHUNK_SIZE:
+            await flush()
+
+    await flush()
+    return stats
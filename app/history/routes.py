@@ -1,41 +1,112 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+import zlib
+from datetime import timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.database import get_async_session
+from app.database import get_async_session, get_read_session, IS_SQLITE
 from app import models
-from app.schemas import SessionCreate, SessionOut
-from app.auth.router import get_current_user
+from app.schemas import (
+    SessionCreate,
+    SessionOut,
+    SessionPage,
+    SessionStatsPage,
+    SessionBulkDelete,
+    SessionBulkDeleteOut,
+    MessagePage,
+    SearchHit,
+)
+from app.auth.cache import Principal
+from app.auth.router import get_current_user, get_current_user_readonly
+from app.history import crud
 from app.history.crud import get_messages_by_session
+from app.history.search import search_messages
+from app.history.export import (
+    MEDIA_TYPES,
+    HistoryImportError,
+    export_history,
+    import_history,
+)
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
 router = APIRouter(prefix="/history", tags=["History"])
 
+logger = logging.getLogger(__name__)
+
+
+# --- Условный GET ---
+# ETag строится из счётчика версий (crud.bump_versions), который читается
+# одним запросом по первичному ключу. Совпал с If-None-Match — отвечаем 304,
+# не загружая и не сериализуя строки. Версия читается до данных, поэтому
+# гонка с записью даёт в худшем случае лишний 200, но не устаревший 304.
+def make_etag(kind: str, key: int, version: int) -> str:
+    return f'W/"{kind}{key}.{version}"'
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+    header = request.headers.get("if-none-match")
+    if header:
+        tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers=headers)
+    return None
 
-# 1. GET /history/sessions
-@router.get("/sessions", response_model=list[SessionOut])
+
+# 1. GET /history/sessions?limit=&cursor=&with_stats=
+@router.get("/sessions", response_model=SessionPage | SessionStatsPage)
 async def get_sessions(
-    session: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: int | None = Query(None, description="next_cursor из предыдущей страницы"),
+    with_stats: bool = Query(False, description="число сообщений и превью последнего"),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: Principal = Depends(get_current_user_readonly)
 ):
-    query = (
-        select(models.Session)
-        .where(models.Session.user_id == current_user.id)
-        .order_by(models.Session.created_at.desc())
-    )
+    version = await crud.get_history_version(session, current_user.id)
+    cached = not_modified(request, response, make_etag("u", current_user.id, version or 0))
+    if cached:
+        return cached
 
-    result = await session.execute(query)
-    sessions = result.scalars().all()
+    if with_stats:
+        rows = await crud.get_sessions_with_stats(
+            session, current_user.id, limit=limit + 1, cursor=cursor
+        )
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return SessionStatsPage(items=rows[:limit], next_cursor=next_cursor)
 
-    return sessions
+    sessions = await crud.get_sessions(
+        session, current_user.id, limit=limit + 1, cursor=cursor
+    )
+    return SessionPage(
+        items=sessions[:limit],
+        next_cursor=crud.next_cursor(sessions, limit)
+    )
 
 
 # 2. GET /history/sessions/{session_id}
 @router.get("/sessions/{session_id}", response_model=SessionOut)
 async def get_session(
     session_id: int,
-    session: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_read_session),
+    current_user: Principal = Depends(get_current_user_readonly)
 ):
+    version = await crud.get_session_version(session, session_id, current_user.id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    cached = not_modified(request, response, make_etag("s", session_id, version))
+    if cached:
+        return cached
+
     query = (
         select(models.Session)
         .where(
@@ -57,34 +128,45 @@ async def get_session(
 async def delete_session(
     session_id: int,
     session: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    query = (
-        select(models.Session)
-        .where(
-            models.Session.id == session_id,
-            models.Session.user_id == current_user.id
-        )
-    )
-    result = await session.execute(query)
-    session_obj = result.scalar_one_or_none()
-
-    if not session_obj:
+    # Один DELETE по сессии; сообщения и архив удаляет БД (ON DELETE CASCADE)
+    deleted = await crud.delete_sessions(session, current_user.id, session_ids=[session_id])
+    if not deleted:
         raise HTTPException(status_code=404, detail="Сессия не найдена")
 
-    await session.delete(session_obj)
-    await session.commit()
-
     return {"status": "deleted"}
 
 
+# 3a. POST /history/sessions/delete  {"ids": [...]} и/или {"older_than": "..."}
+@router.post("/sessions/delete", response_model=SessionBulkDeleteOut)
+async def delete_sessions(
+    data: SessionBulkDelete,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: Principal = Depends(get_current_user)
+):
+    if data.ids is None and data.older_than is None:
+        raise HTTPException(status_code=400, detail="Нужны ids или older_than")
+
+    older_than = data.older_than
+    if older_than is not None and older_than.tzinfo is not None:
+        # created_at хранится в UTC без часового пояса
+        older_than = older_than.astimezone(timezone.utc).replace(tzinfo=None)
+
+    deleted = await crud.delete_sessions(
+        session, current_user.id, session_ids=data.ids, older_than=older_than
+    )
+    logger.debug("user %s deleted %s sessions", current_user.id, deleted)
+    return SessionBulkDeleteOut(deleted=deleted)
+
+
 # 4. PUT /history/sessions/{session_id}/title
 @router.put("/sessions/{session_id}/title", response_model=SessionOut)
 async def update_title(
     session_id: int,
     data: SessionCreate,
     session: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     query = (
         select(models.Session)
@@ -100,6 +182,7 @@ async def update_title(
         raise HTTPException(status_code=404, detail="Сессия не найдена")
 
     session_obj.title = data.title
+    await crud.bump_versions(session, session_ids=[session_id])
     await session.commit()
     await session.refresh(session_obj)
 
@@ -111,42 +194,104 @@ async def update_title(
 async def create_session(
     data: SessionCreate,
     session: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    print("create_session called, user:", current_user)
-
     new_session = models.Session(
         user_id=current_user.id,
         title=data.title
     )
 
     session.add(new_session)
+    await crud.bump_versions(session, user_ids=[current_user.id])
     await session.commit()
     await session.refresh(new_session)
+    logger.debug("session %s created by user %s", new_session.id, current_user.id)
 
     return new_session
 
 
 @router.get(
     "/sessions/{session_id}/messages",
-    response_model=list[SessionOut]
+    response_model=MessagePage
 )
 async def get_messages(
     session_id: int,
-    db: AsyncSession = Depends(get_async_session),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: int | None = Query(None, description="next_cursor из предыдущей страницы"),
+    db: AsyncSession = Depends(get_read_session),
+    current_user: Principal = Depends(get_current_user_readonly)
 ):
-    # проверяем, что сессия принадлежит пользователю
-    result = await db.execute(
-        select(models.Session).where(
-            models.Session.id == session_id,
-            models.Session.user_id == current_user.id
-        )
+    # версия заодно проверяет, что сессия принадлежит пользователю
+    version = await crud.get_session_version(db, session_id, current_user.id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    cached = not_modified(request, response, make_etag("s", session_id, version))
+    if cached:
+        return cached
+
+    messages = await get_messages_by_session(
+        db, session_id, current_user.id, limit=limit + 1, cursor=cursor
+    )
+    return MessagePage(
+        items=messages[:limit],
+        next_cursor=crud.next_cursor(messages, limit)
     )
-    session_obj = result.scalar_one_or_none()
 
-    if not session_obj:
-        raise HTTPException(status_code=404, detail="Сессия не найдена")
 
-    messages = await get_messages_by_session(db, session_id)
-    return messages
\ No newline at end of file
+# GET /history/search?q=  — полнотекстовый поиск по своим сообщениям
+@router.get("/search", response_model=list[SearchHit])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_session),
+    current_user: Principal = Depends(get_current_user_readonly)
+):
+    if not IS_SQLITE:
+        raise HTTPException(status_code=501, detail="Поиск доступен только на SQLite (FTS5)")
+    return await search_messages(db, current_user.id, q, limit)
+
+
+# GET /history/export?format=ndjson|csv&gzip=  — вся история одним потоком
+@router.get("/export")
+async def export(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = Query(False, description="сжать выгрузку (файл .gz)"),
+    current_user: Principal = Depends(get_current_user_readonly)
+):
+    filename = f"history-{current_user.id}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_history(current_user.id, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# POST /history/import?format=ndjson|csv  — тело в формате /export
+# (Content-Encoding: gzip — для сжатого файла)
+@router.post("/import")
+async def import_(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: Principal = Depends(get_current_user)
+):
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    try:
+        stats = await import_history(db, current_user.id, request.stream(), format, gzipped)
+    except HistoryImportError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except zlib.error:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Тело не является gzip")
+    except UnicodeDecodeError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Файл должен быть в UTF-8")
+    logger.debug("user %s imported %s", current_user.id, stats)
+    return {"status": "imported", **stats}
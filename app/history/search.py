@@ -0,0 +1,102 @@
+import html
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Частые русские окончания: отрезаем самое длинное и ищем по префиксу,
+# чтобы «амортизации» находило «амортизация», «амортизацию» и т.д.
+_RU_ENDINGS = sorted(
+    [
+        "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией",
+        "ия", "ие", "ий", "ии", "ию", "ой", "ый", "ая", "яя", "ое", "ее",
+        "ам", "ям", "ах", "ях", "ов", "ев", "ом", "ем", "ую", "юю", "ых", "их",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+    ],
+    key=len,
+    reverse=True,
+)
+_MIN_STEM = 4
+_WORD = re.compile(r"\w+")
+
+
+def stem(word: str) -> str:
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[: -len(ending)]
+    return word
+
+
+def build_match_query(query: str) -> str | None:
+    """
+    Пользовательский ввод -> выражение FTS5 MATCH: каждое слово
+    в кавычках (спецсимволы FTS не ломают запрос) и с «*» на конце;
+    слова объединяются через AND.
+    """
+    words = _WORD.findall(query.casefold().replace("ё", "е"))
+    if not words:
+        return None
+    return " ".join(f'"{stem(w)}"*' for w in words)
+
+
+# Границы совпадения в snippet — символы из Private Use Area: текст
+# сообщения сначала экранируется, и только потом они становятся <mark>
+_MARK_OPEN, _MARK_CLOSE = "\ue000", "\ue001"
+
+
+def render_snippet(snippet: str) -> str:
+    """snippet FTS с маркерами -> безопасный HTML с подсветкой <mark>."""
+    return (
+        html.escape(snippet)
+        .replace(_MARK_OPEN, "<mark>")
+        .replace(_MARK_CLOSE, "</mark>")
+    )
+
+
+# Горячие сообщения (messages_fts) и архивные (archive_fts) — одним
+# запросом; в archive_fts совпадение ищется только в колонке text
+_SEARCH_SQL = text("""
+    SELECT * FROM (
+        SELECT m.id AS message_id,
+               m.session_id AS session_id,
+               s.title AS session_title,
+               m.role AS role,
+               m.created_at AS created_at,
+               snippet(messages_fts, 0, :mark_open, :mark_close, '…', 16) AS snippet,
+               bm25(messages_fts) AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        JOIN sessions s ON s.id = m.session_id
+        WHERE messages_fts MATCH :match AND s.user_id = :user_id
+
+        UNION ALL
+
+        SELECT a.rowid AS message_id,
+               s.id AS session_id,
+               s.title AS session_title,
+               a.role AS role,
+               a.created_at AS created_at,
+               snippet(archive_fts, 0, :mark_open, :mark_close, '…', 16) AS snippet,
+               bm25(archive_fts) AS rank
+        FROM archive_fts a
+        JOIN sessions s ON s.id = CAST(a.sid AS INTEGER)
+        WHERE archive_fts MATCH :archive_match AND s.user_id = :user_id
+    )
+    ORDER BY rank
+    LIMIT :limit
+""")
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str, limit: int) -> list[dict]:
+    """Поиск по сообщениям пользователя, лучшие совпадения (bm25) первыми."""
+    match = build_match_query(query)
+    if match is None:
+        return []
+    result = await db.execute(_SEARCH_SQL, {
+        "match": match, "archive_match": f"text : ({match})", "user_id": user_id, "limit": limit,
+        "mark_open": _MARK_OPEN, "mark_close": _MARK_CLOSE,
+    })
+    return [
+        {**row._mapping, "snippet": render_snippet(row.snippet)}
+        for row in result
+    ]
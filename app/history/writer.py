@@ -0,0 +1,184 @@
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import (
+    HISTORY_WRITE_BEHIND,
+    HISTORY_WRITE_QUEUE_SIZE,
+    HISTORY_WRITE_BATCH_SIZE,
+    HISTORY_WRITE_INTERVAL,
+)
+from app.database import AsyncSessionLocal
+from app.history.crud import save_messages
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def _resolve(written: asyncio.Future | None, error: Exception | None = None) -> None:
+    # Отправитель мог уже уйти (отмена запроса) — тогда будить некого
+    if written is None or written.done():
+        return
+    if error is None:
+        written.set_result(None)
+    else:
+        written.set_exception(error)
+
+
+class MessageWriter:
+    """
+    Write-behind для истории чата: запросы кладут ход (пару сообщений)
+    в ограниченную очередь, фоновая задача пишет накопленное от многих
+    запросов одним коммитом. Полная очередь притормаживает отправителя,
+    при остановке всё оставшееся дописывается. Кому нужен уже записанный
+    ход, ставит его с wait=True и ждёт своего коммита.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.running:
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+
+    async def submit(self, rows: list[dict], wait: bool = False) -> None:
+        written = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((rows, written))
+        if written is not None:
+            await written
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Дописываем то, что успели положить до остановки
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                rest.append(item)
+        if rest:
+            await self._flush(rest)
+
+    async def _flush(self, batch: list[tuple[list[dict], asyncio.Future | None]]) -> None:
+        rows = [row for turn, _ in batch for row in turn]
+        try:
+            async with AsyncSessionLocal() as db:
+                await save_messages(db, rows)
+        except Exception:
+            # Один битый ход не должен терять остальные: пишем по одному
+            logger.exception("Group commit of %d messages failed, retrying per turn", len(rows))
+            for turn, written in batch:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await save_messages(db, turn)
+                    self.written += len(turn)
+                    _resolve(written)
+                except Exception as e:
+                    logger.exception("Dropping %d messages", len(turn))
+                    self.failed += len(turn)
+                    _resolve(written, e)
+        else:
+            self.written += len(rows)
+            for _, written in batch:
+                _resolve(written)
+        self.flushes += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queued": self._queue.qsize(),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+
+message_writer = MessageWriter(
+    max_queue=HISTORY_WRITE_QUEUE_SIZE,
+    batch_size=HISTORY_WRITE_BATCH_SIZE,
+    flush_interval=HISTORY_WRITE_INTERVAL,
+)
+
+
+async def start_message_writer() -> None:
+    if HISTORY_WRITE_BEHIND:
+        await message_writer.start()
+
+
+async def persist_turn(
+    db: AsyncSession,
+    session_id: int,
+    user_text: str,
+    assistant_text: str,
+    wait: bool = False
+) -> None:
+    """
+    Сохраняет ход чата: вопрос и ответ. С включённым write-behind
+    только ставит их в очередь (wait=True — и ждёт записи),
+    иначе пишет сразу одной транзакцией.
+    """
+    rows = [
+        {"session_id": session_id, "role": "user", "text": user_text},
+        {"session_id": session_id, "role": "assistant", "text": assistant_text},
+    ]
+    if message_writer.running:
+        await message_writer.submit(rows, wait=wait)
+    else:
+        await save_messages(db, rows)
+
+
+_detached: set[asyncio.Task] = set()
+
+
+async def persist_turn_detached(session_id: int, user_text: str, assistant_text: str) -> None:
+    """
+    persist_turn своей короткой сессией БД в отдельной задаче. Отмена
+    вызывающего (клиент отключился посреди потокового ответа) прерывает
+    только ожидание: ход всё равно будет записан.
+    """
+    async def write():
+        async with AsyncSessionLocal() as db:
+            await persist_turn(db, session_id, user_text, assistant_text)
+
+    task = asyncio.create_task(write())
+    _detached.add(task)
+    task.add_done_callback(_detached.discard)
+    await asyncio.shield(task)
@@ -1,38 +1,34 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+from app.core.log import setup_logging, RequestContextMiddleware
+setup_logging()
+
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from fastapi.security import HTTPBearer
 
 import asyncio
 
-from app.database import engine
-from app import models
+from app.database import engine, read_engine, close_engines
+from app.core.config import GZIP_MIN_SIZE
+from app.core.metrics import MetricsMiddleware, instrument_engine, pool_metrics, registry
+from app.core.startup import init_database
+from app.ai.client import init_ai_client, close_ai_client
+from app.ai.retrieval import retrieval_index
+from app.history.writer import start_message_writer, message_writer
 
 from app.auth.router import router as auth_router
 from app.history.routes import router as history_router
 from app.chat.router import router as chat_router
+from app.chat.jobs import router as chat_jobs_router, chat_jobs
+from app.chat.ws import router as chat_ws_router
+from app.routes.routes import router as service_router
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 
 
-print(">>> MAIN.PY LOADED <<<")
-
-
-# ======================================================
-#         АСИНХРОННАЯ ИНИЦИАЛИЗАЦИЯ БАЗЫ
-# ======================================================
-
-async def init_models():
-    """
-    Создаёт все таблицы через AsyncEngine.
-    Вызывается один раз при старте приложения.
-    """
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
-
-
 # ======================================================
 #                 СОЗДАНИЕ ПРИЛОЖЕНИЯ
 # ======================================================
@@ -60,11 +56,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ------------------------------------------------------
+#                     СЖАТИЕ
+# ------------------------------------------------------
+
+# Большие JSON (страницы сообщений, выгрузка) — gzip, если клиент согласен.
+# text/event-stream и уже сжатое (application/gzip) middleware не трогает.
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+# ------------------------------------------------------
+#                     МЕТРИКИ
+# ------------------------------------------------------
 
-# Инициализация БД перед стартом сервера
+engines = {"write": engine}
+if read_engine is not engine:
+    engines["read"] = read_engine
+for _engine in engines.values():
+    instrument_engine(_engine.sync_engine)
+registry.register(pool_metrics(engines))
+
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+
+# Схема БД (режим DB_INIT_MODE, см. app/core/startup.py), общий AI-клиент,
+# локальный индекс FAQ, фоновая запись истории и воркеры чата в режиме заданий
 @app.on_event("startup")
 async def on_startup():
-    await init_models()
+    await init_database()
+    await init_ai_client()
+    await retrieval_index.start()
+    await start_message_writer()
+    await chat_jobs.start()
+
+
+# Дорабатываем принятые задания, дописываем очередь истории
+# и закрываем пулы соединений к AI и БД
+@app.on_event("shutdown")
+async def on_shutdown():
+    await chat_jobs.stop()
+    await retrieval_index.stop()
+    await message_writer.stop()
+    await close_ai_client()
+    await close_engines()
 
 
 # ======================================================
@@ -74,6 +108,9 @@ async def on_startup():
 app.include_router(auth_router)
 app.include_router(history_router)
 app.include_router(chat_router)
+app.include_router(chat_jobs_router)
+app.include_router(chat_ws_router)
+app.include_router(service_router)
 
 
 # ======================================================
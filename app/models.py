@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, LargeBinary, Index, DDL, event, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -10,29 +10,159 @@ class User(Base):
     username = Column(String, unique=True, nullable=False, index=True)
     password_hash = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Растёт при любом изменении истории пользователя (ETag списка сессий)
+    history_version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    sessions = relationship("Session", back_populates="user", cascade="all, delete")
+    # Дочерние строки удаляет сама БД (ON DELETE CASCADE): ORM их не загружает
+    sessions = relationship("Session", back_populates="user", cascade="all, delete", passive_deletes=True)
+
+    __table_args__ = (
+        # id удалённого пользователя не достаётся новому (его JWT ещё жив)
+        {"sqlite_autoincrement": True},
+    )
 
 
 class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Свёрнутое содержание старых сообщений и id последнего из них
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
+    # Растёт при новых сообщениях и переименовании (ETag сессии и её сообщений)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="sessions")
-    messages = relationship("Message", back_populates="session", cascade="all, delete")
+    messages = relationship("Message", back_populates="session", cascade="all, delete", passive_deletes=True)
+    archive = relationship("MessageArchive", uselist=False, cascade="all, delete", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_sessions_user_id_created_at", "user_id", "created_at"),
+        # id удалённых сессий не переиспользуются: иначе новая сессия
+        # совпала бы по ETag и контексту в памяти со старой
+        {"sqlite_autoincrement": True},
+    )
 
 
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
     role = Column(String, nullable=False)  # user / assistant
     text = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     session = relationship("Session", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_messages_session_id_created_at", "session_id", "created_at"),
+        # id не переиспользуются после удаления/архивации (иначе новые
+        # сообщения получили бы id заархивированных)
+        {"sqlite_autoincrement": True},
+    )
+
+
+class MessageArchive(Base):
+    """
+    Холодное хранилище: все сообщения давно неактивной сессии одним
+    zlib-сжатым JSON (см. app/history/archive.py). Счётчик и последнее
+    сообщение продублированы, чтобы список сессий не распаковывал blob.
+    """
+    __tablename__ = "message_archives"
+
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_preview = Column(Text, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChatJobRecord(Base):
+    """
+    Задание чата (app/chat/jobs.py). Очередь и воркеры живут в процессе,
+    принявшем задание, а статус и ответ — здесь: их видит любой процесс.
+    seq задаёт порядок ходов одной сессии между процессами.
+    """
+    __tablename__ = "chat_jobs"
+
+    seq = Column(Integer, primary_key=True)
+    id = Column(String(32), unique=True, nullable=False)  # uuid4().hex, отдаётся клиенту
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String, nullable=False, default="queued", server_default="queued")  # queued / running / done / failed
+    answer = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_chat_jobs_session_id_seq", "session_id", "seq"),
+        # seq удалённых заданий не переиспользуются: порядок ходов только растёт
+        {"sqlite_autoincrement": True},
+    )
+
+
+# --- Полнотекстовый поиск по messages.text (SQLite FTS5) ---
+# Индекс external-content: текст хранится только в messages, FTS читает его
+# через view, где «ё» заменено на «е» (unicode61 их не склеивает).
+# Синхронизацию держат триггеры, поэтому любой путь записи попадает в индекс.
+_FTS_NORMALIZE = "replace(replace({col}, 'ё', 'е'), 'Ё', 'Е')"
+
+MESSAGES_FTS_DDL = [
+    f"""CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, {_FTS_NORMALIZE.format(col="text")} AS text FROM messages""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text,
+        content='messages_fts_source',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_FTS_NORMALIZE.format(col="new.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_FTS_NORMALIZE.format(col="old.text")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text)
+        VALUES ('delete', old.id, {_FTS_NORMALIZE.format(col="old.text")});
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, {_FTS_NORMALIZE.format(col="new.text")});
+    END""",
+]
+
+for _ddl in MESSAGES_FTS_DDL:
+    event.listen(Message.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
+
+
+# --- Поиск по архиву (app/history/archive.py) ---
+# Архивированные сообщения уходят из messages, а с ними и из messages_fts.
+# Их текст индексируется в отдельной FTS-таблице со своим содержимым:
+# rowid — id сообщения, sid — id сессии (индексируется, чтобы удалять
+# строки сессии через MATCH, а не перебором), «ё» заменено при записи.
+# Удаление архива (в том числе каскадом от сессии/пользователя) чистит индекс.
+ARCHIVE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS archive_fts USING fts5(
+        text,
+        sid,
+        role UNINDEXED,
+        created_at UNINDEXED,
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS archive_fts_ad AFTER DELETE ON message_archives BEGIN
+        DELETE FROM archive_fts WHERE rowid IN (
+            SELECT rowid FROM archive_fts WHERE sid MATCH old.session_id
+        );
+    END""",
+]
+
+for _ddl in ARCHIVE_FTS_DDL:
+    event.listen(MessageArchive.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
@@ -0,0 +1,102 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.ai.cache import answer_cache
+from app.ai.singleflight import ai_singleflight
+from app.ai.limiter import upstream_limiter
+from app.ai.breaker import ai_breaker
+from app.ai.client import resilience_stats
+from app.ai.retrieval import retrieval_index
+from app.auth.cache import principal_cache
+from app.auth.utils import password_hashing_stats
+from app.chat.ratelimit import chat_rate_limiter
+from app.chat.jobs import chat_jobs
+from app.core.config import ADMIN_TOKEN, ARCHIVE_AFTER_DAYS
+from app.core.metrics import registry, CallbackMetric
+from app.history.archive import archive_stats, run_archive
+from app.history.writer import message_writer
+
+router = APIRouter(tags=["Service"])
+
+
+# Счётчики горячего пути: кэш ответов AI, склейка одинаковых запросов,
+# фоновая запись истории, кэш аутентифицированных пользователей,
+# пул bcrypt, последний прогон архивации, допуск к чату и к AI,
+# состояние circuit breaker, повторы и hedging, очередь заданий чата,
+# локальные ответы по FAQ
+def collect_stats() -> dict:
+    return {
+        "ai_cache": answer_cache.stats(),
+        "ai_singleflight": ai_singleflight.stats(),
+        "history_writer": message_writer.stats(),
+        "auth_principals": principal_cache.stats(),
+        "password_hashing": password_hashing_stats(),
+        "history_archive": archive_stats(),
+        "chat_rate_limit": chat_rate_limiter.stats(),
+        "ai_upstream_limiter": upstream_limiter.stats(),
+        "ai_breaker": ai_breaker.stats(),
+        "ai_resilience": resilience_stats(),
+        "chat_jobs": chat_jobs.stats(),
+        "ai_retrieval": retrieval_index.stats(),
+    }
+
+
+@router.get("/stats")
+async def stats():
+    return collect_stats()
+
+
+def _stats_samples():
+    for component, values in collect_stats().items():
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                yield (component, name), float(value)
+
+
+registry.register(CallbackMetric(
+    "app_component_stat", "Counters and gauges from GET /stats", "gauge",
+    ("component", "stat"), _stats_samples,
+))
+
+
+# Prometheus text format
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# --- Служебные операции (заголовок X-Admin-Token) ---
+def require_admin(x_admin_token: str = Header("")):
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+
+# Архивация неактивных сессий; то же — python -m app.history.archive
+@router.post("/admin/archive", dependencies=[Depends(require_admin)])
+async def archive(
+    days: int = Query(ARCHIVE_AFTER_DAYS, ge=0),
+    vacuum: bool = Query(False, description="после архивации выполнить VACUUM")
+):
+    return await run_archive(days=days, vacuum=vacuum)
+
+
+# Ответы из истории в общий индекс FAQ — только после просмотра человеком
+@router.get("/admin/retrieval/candidates", dependencies=[Depends(require_admin)])
+async def retrieval_candidates(limit: int = Query(50, ge=1, le=500)):
+    return await retrieval_index.candidates(limit)
+
+
+@router.post("/admin/retrieval/approved/{session_id}", dependencies=[Depends(require_admin)])
+async def retrieval_approve(session_id: int):
+    doc = await retrieval_index.approve(session_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="В сессии нет вопроса с ответом AI")
+    return doc
+
+
+@router.delete("/admin/retrieval/approved/{session_id}", status_code=204, dependencies=[Depends(require_admin)])
+async def retrieval_revoke(session_id: int):
+    if not await retrieval_index.revoke(session_id):
+        raise HTTPException(status_code=404, detail="Ответ не найден")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 
@@ -34,9 +34,68 @@ class SessionOut(BaseModel):
         from_attributes = True
 
 
+class SessionPage(BaseModel):
+    items: list[SessionOut]
+    next_cursor: int | None = None
+
+
+class SessionBulkDelete(BaseModel):
+    ids: list[int] | None = Field(None, max_length=1000)
+    older_than: datetime | None = None  # сессии, созданные раньше
+
+
+class SessionBulkDeleteOut(BaseModel):
+    status: str = "deleted"
+    deleted: int
+
+
+class SessionStatsOut(SessionOut):
+    message_count: int
+    last_message_at: datetime | None = None
+    last_message_preview: str | None = None
+
+
+class SessionStatsPage(BaseModel):
+    items: list[SessionStatsOut]
+    next_cursor: int | None = None
+
+
+class MessageOut(BaseModel):
+    id: int
+    role: str
+    text: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class MessagePage(BaseModel):
+    items: list[MessageOut]
+    next_cursor: int | None = None
+
+
+class SearchHit(BaseModel):
+    message_id: int
+    session_id: int
+    session_title: str | None
+    role: str
+    snippet: str
+    created_at: datetime
+    rank: float
+
+
 class ChatQueryRequest(BaseModel):
     message: str
     session_id: int
+    use_cache: bool = True  # False — не брать ответ из кэша
 
 class ChatQueryResponse(BaseModel):
     answer: str
+
+
+class ChatJobOut(BaseModel):
+    job_id: str
+    status: str  # queued / running / done / failed
+    answer: str | None = None
+    error: str | None = None
@@ -0,0 +1,65 @@
+"""
+Общие помощники для бенчмарков: локальный mock AI и перцентили.
+Запускать из корня репозитория: python -m bench.<имя>
+"""
+import contextlib
+import os
+import socket
+import threading
+import time
+
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_mock_ai(latency: float = 0.0):
+    """
+    Поднимает mock_ai.py в фоновом потоке и выставляет AI_BASE_URL/AI_API_KEY,
+    поэтому модули app.* нужно импортировать уже внутри блока.
+    """
+    import mock_ai
+
+    mock_ai.MOCK_AI_LATENCY = latency
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(mock_ai.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ["AI_BASE_URL"] = base_url
+    os.environ.setdefault("AI_API_KEY", "bench")
+    try:
+        yield base_url
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Латентности в секундах -> сводка в миллисекундах."""
+    return {
+        "count": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
@@ -0,0 +1,77 @@
+"""
+Латентность вызова AI: новый httpx.AsyncClient на каждый запрос (как было)
+против общего пула keep-alive соединений (app.ai.client).
+
+    python -m bench.ai_client --requests 500 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from bench._common import run_mock_ai, summarize
+
+
+async def per_request_client(base_url: str, api_key: str, n: int, concurrency: int) -> list[float]:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            started = time.perf_counter()
+            async with httpx.AsyncClient(timeout=35.0) as client:
+                response = await client.post(
+                    f"{base_url}/assistant/query",
+                    headers={"Content-Type": "application/json", "X-API-Key": api_key},
+                    json={"query": f"вопрос {i}", "session_id": "1", "history": []},
+                )
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies
+
+
+async def shared_client(n: int, concurrency: int) -> list[float]:
+    from app.ai.client import ask_ai_assistant, init_ai_client, close_ai_client
+
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            started = time.perf_counter()
+            await ask_ai_assistant(query=f"вопрос {i}", session_id="1", history=[])
+            latencies.append(time.perf_counter() - started)
+
+    await init_ai_client()
+    try:
+        await asyncio.gather(*(one(i) for i in range(n)))
+    finally:
+        await close_ai_client()
+    return latencies
+
+
+async def main(args):
+    with run_mock_ai(latency=args.latency) as base_url:
+        before = await per_request_client(base_url, os.environ["AI_API_KEY"], args.requests, args.concurrency)
+        after = await shared_client(args.requests, args.concurrency)
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mock_latency_s": args.latency,
+        "per_request_client": summarize(before),
+        "shared_client": summarize(after),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка mock AI, сек")
+    asyncio.run(main(parser.parse_args()))
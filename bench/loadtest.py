@@ -0,0 +1,184 @@
+"""
+Нагрузочный прогон: реальное приложение в этом же процессе (ASGITransport)
+против mock_ai.py с искусственной задержкой, временная SQLite-база.
+Смешанный сценарий на каждого виртуального пользователя:
+register/login -> создание/список/переименование сессий -> вопросы в чат
+-> чтение сообщений -> удаление сессии.
+Итог — JSON с RPS, p50/p95/p99 и долей ошибок по маршрутам.
+
+    python -m bench.loadtest --users 50 --chats 5 --ai-latency 0.2 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench._common import run_mock_ai, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "Когда платить НДС за квартал?",
+    "Сроки сдачи 6-НДФЛ",
+    "Как начислять амортизацию основных средств?",
+    "Какие взносы платит ИП за себя?",
+    "Как отразить аванс от покупателя?",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            self.latencies[name].append(time.perf_counter() - started)
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for name in sorted(self.latencies):
+            values = self.latencies[name]
+            routes[name] = {
+                **summarize(values),
+                "rps": round(len(values) / elapsed, 2),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(values), 4),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        return {
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "routes": routes,
+        }
+
+
+async def virtual_user(client, rec: Recorder, n: int, args, rnd: random.Random):
+    creds = {"username": f"load{n}_{rnd.randrange(10**9)}", "password": "secret"}
+    await rec.call(client, "POST /auth/register", "POST", "/auth/register", json=creds)
+    r = await rec.call(client, "POST /auth/login", "POST", "/auth/login", json=creds)
+    if r is None or r.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    session_ids = []
+    for i in range(args.sessions):
+        r = await rec.call(client, "POST /history/sessions/create", "POST", "/history/sessions/create",
+                           json={"title": f"Сессия {i}"}, headers=headers)
+        if r is not None and r.status_code == 200:
+            session_ids.append(r.json()["id"])
+    if not session_ids:
+        return
+
+    await rec.call(client, "GET /history/sessions", "GET", "/history/sessions", headers=headers)
+
+    for sid in session_ids:
+        await rec.call(client, "PUT /history/sessions/{id}/title", "PUT", f"/history/sessions/{sid}/title",
+                       json={"title": "Переименована"}, headers=headers)
+
+    for _ in range(args.chats):
+        sid = rnd.choice(session_ids)
+        await rec.call(client, "POST /api/v1/chat/query", "POST", "/api/v1/chat/query",
+                       json={"message": rnd.choice(QUESTIONS), "session_id": sid}, headers=headers)
+
+    for sid in session_ids:
+        await rec.call(client, "GET /history/sessions/{id}/messages", "GET",
+                       f"/history/sessions/{sid}/messages", headers=headers)
+
+    await rec.call(client, "DELETE /history/sessions/{id}", "DELETE",
+                   f"/history/sessions/{session_ids[0]}", headers=headers)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    sys.path.insert(0, REPO_ROOT)
+    # stdout — для итогового JSON, логи приложения только от WARNING
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    db_dir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_dir}/load.db"
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    # Меряем пропускную способность, а не лимит на пользователя;
+    # чтобы проверить допуск к чату, задайте CHAT_RATE_PER_MINUTE явно
+    os.environ.setdefault("CHAT_RATE_PER_MINUTE", "0")
+
+    with run_mock_ai(latency=args.ai_latency):
+        from app.main import app
+
+        rec = Recorder()
+        rnd = random.Random(args.seed)
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=transport, base_url="http://app", timeout=args.timeout
+        ) as client:
+            sem = asyncio.Semaphore(args.concurrency)
+
+            async def run_user(n: int):
+                async with sem:
+                    await virtual_user(client, rec, n, args, random.Random(rnd.random()))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_user(n) for n in range(args.users)))
+            elapsed = time.perf_counter() - started
+
+    result = {
+        "revision": git_revision(),
+        "config": {
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "sessions_per_user": args.sessions,
+            "chats_per_user": args.chats,
+            "ai_latency_s": args.ai_latency,
+            "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+            "seed": args.seed,
+        },
+        **rec.report(elapsed),
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=20, help="сколько пользователей активны одновременно")
+    parser.add_argument("--sessions", type=int, default=3, help="сессий на пользователя")
+    parser.add_argument("--chats", type=int, default=5, help="вопросов в чат на пользователя")
+    parser.add_argument("--ai-latency", type=float, default=0.1, help="задержка mock AI, сек")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12,
+                        help="стоимость bcrypt, если BCRYPT_ROUNDS не задан в окружении")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="куда дополнительно записать JSON")
+    asyncio.run(main(parser.parse_args()))
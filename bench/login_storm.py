@@ -0,0 +1,95 @@
+"""
+p99 латентности чата во время «шторма» логинов.
+Приложение крутится в этом же event loop (ASGITransport), поэтому любое
+блокирующее хэширование bcrypt сразу видно по задержкам чата.
+
+    python -m bench.login_storm --logins 40 --chats 100
+    python -m bench.login_storm --inline-bcrypt   # как было: bcrypt прямо в loop
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench._common import run_mock_ai, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def main(args):
+    sys.path.insert(0, REPO_ROOT)
+    # stdout — для итогового JSON, логи приложения только от WARNING
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(tempfile.mkdtemp(prefix="login-storm-"))
+
+    with run_mock_ai(latency=args.latency):
+        from app.main import app
+        from app.auth import router as auth_router
+        from app.auth.utils import verify_password
+
+        if args.inline_bcrypt:
+            async def verify_inline(plain, hashed):
+                return verify_password(plain, hashed)
+            auth_router.verify_password_async = verify_inline
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=transport, base_url="http://app", timeout=60
+        ) as client:
+            creds = {"username": f"storm{time.time_ns()}", "password": "secret"}
+            token = (await client.post("/auth/register", json=creds)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            session_id = (await client.post(
+                "/history/sessions/create", json={"title": "bench"}, headers=headers
+            )).json()["id"]
+
+            async def chat_loop(latencies):
+                for i in range(args.chats):
+                    started = time.perf_counter()
+                    r = await client.post(
+                        "/api/v1/chat/query",
+                        json={"message": f"вопрос {i}", "session_id": session_id, "use_cache": False},
+                        headers=headers,
+                    )
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            async def login_storm(statuses):
+                sem = asyncio.Semaphore(args.login_concurrency)
+
+                async def one():
+                    async with sem:
+                        r = await client.post("/auth/login", json=creds)
+                        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+                await asyncio.gather(*(one() for _ in range(args.logins)))
+
+            baseline = []
+            await chat_loop(baseline)
+
+            during, statuses = [], {}
+            await asyncio.gather(chat_loop(during), login_storm(statuses))
+
+    print(json.dumps({
+        "mode": "inline" if args.inline_bcrypt else "executor",
+        "logins": args.logins,
+        "login_statuses": statuses,
+        "chat_idle": summarize(baseline),
+        "chat_during_login_storm": summarize(during),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка mock AI, сек")
+    parser.add_argument("--inline-bcrypt", action="store_true",
+                        help="считать bcrypt прямо в event loop (поведение до выноса в пул)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+Время холодного старта: импорт app.main, startup-хук (подготовка БД,
+AI-клиент, фоновые задачи) и первый запрос. Каждый замер — отдельный
+процесс Python, как у нового воркера; --procs N запускает N процессов
+одновременно на одном файле БД (гонка воркеров за DDL).
+
+    python -m bench.startup_time --runs 5
+    python -m bench.startup_time --mode create_all --procs 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench._common import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def child() -> dict:
+    """Один замер внутри свежего процесса."""
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            (await client.get("/")).raise_for_status()
+            first = time.perf_counter()
+            # Первый запрос, которому нужна БД (роутер, зависимости, пул соединений)
+            r = await client.post("/auth/login", json={"username": "nobody", "password": "x"})
+            assert r.status_code in (400, 401), r.status_code
+            first_db = time.perf_counter()
+
+    return {
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_request_ms": (first - ready) * 1000,
+        "first_db_request_ms": (first_db - first) * 1000,
+    }
+
+
+def spawn(workdir: str, env: dict, procs: int) -> list[dict]:
+    popen = [
+        subprocess.Popen(
+            [sys.executable, "-m", "bench.startup_time", "--child"],
+            cwd=workdir, env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(procs)
+    ]
+    results = []
+    for p in popen:
+        out, _ = p.communicate()
+        if p.returncode != 0:
+            raise SystemExit(f"замер упал (код {p.returncode})")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def summarize_runs(runs: list[dict]) -> dict:
+    return {
+        key: {
+            "p50_ms": round(percentile([r[key] for r in runs], 50), 1),
+            "max_ms": round(max(r[key] for r in runs), 1),
+        }
+        for key in runs[0]
+    }
+
+
+def main(args) -> None:
+    workdir = tempfile.mkdtemp(prefix="startup-time-")
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "DB_INIT_MODE": args.mode,
+        "DB_INIT_LOCK_FILE": os.path.join(workdir, "db_init.lock"),
+        "AI_BASE_URL": os.environ.get("AI_BASE_URL", "http://127.0.0.1:9"),
+        "AI_API_KEY": os.environ.get("AI_API_KEY", "bench"),
+    }
+
+    # Первый прогон — пустая БД: сюда попадает создание схемы
+    started = time.perf_counter()
+    cold = spawn(workdir, env, args.procs)
+    cold_wall = time.perf_counter() - started
+
+    warm = []
+    for _ in range(args.runs):
+        warm += spawn(workdir, env, args.procs)
+
+    print(json.dumps({
+        "mode": args.mode,
+        "procs": args.procs,
+        "cold_db": {**summarize_runs(cold), "wall_ms": round(cold_wall * 1000, 1)},
+        "warm_db": summarize_runs(warm),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", default="migrate",
+                        choices=["create_all", "migrate", "check", "none"],
+                        help="DB_INIT_MODE для замеряемых процессов")
+    parser.add_argument("--runs", type=int, default=5, help="замеров на уже готовой БД")
+    parser.add_argument("--procs", type=int, default=1, help="процессов одновременно")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child())))
+    else:
+        main(args)
@@ -0,0 +1,35 @@
+"""
+Запуск в несколько процессов с предзагрузкой приложения:
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Мастер один раз импортирует app.main и готовит схему БД (DB_INIT_MODE),
+воркеры получают всё это через fork: импорт роутеров и DDL не повторяются
+в каждом процессе, а холодный старт воркера — это только startup-хук
+(AI-клиент, фоновые задачи).
+
+Задания чата (POST /api/v1/chat/jobs) выполняет принявший их воркер, но
+статус и ответ лежат в таблице chat_jobs: GET отвечает из любого воркера,
+привязывать клиента к процессу не нужно.
+"""
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def on_starting(server):
+    # Приложение уже импортировано (preload_app) — готовим схему в мастере
+    from app.core.startup import prepare_database
+    prepare_database()
+
+
+def post_fork(server, worker):
+    # Пулы, унаследованные от мастера, не используем: соединения
+    # SQLite/aiosqlite нельзя делить между процессами
+    from app.database import engine, read_engine
+    engine.sync_engine.dispose(close=False)
+    if read_engine is not engine:
+        read_engine.sync_engine.dispose(close=False)
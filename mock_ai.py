@@ -1,21 +1,89 @@
 # mock_ai.py
+import asyncio
+import json
+import os
+import random
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
 
 app = FastAPI(title="Mock AI Service", version="1.0")
 
-# Схема запроса от твоего эндпоинта
+# Искусственная задержка ответа (секунды), чтобы имитировать реальный AI
+MOCK_AI_LATENCY = float(os.getenv("MOCK_AI_LATENCY", 0.0))
+# Пауза между кусками в потоковом режиме (секунды)
+MOCK_AI_CHUNK_DELAY = float(os.getenv("MOCK_AI_CHUNK_DELAY", 0.05))
+
+# --- Внедрение сбоев (для проверки circuit breaker, повторов и hedging) ---
+# Меняются и на лету: POST /mock/faults {"error_rate": 1.0, ...}
+FAULTS = {
+    # доля запросов, на которые отвечаем ошибкой error_status
+    "error_rate": float(os.getenv("MOCK_AI_ERROR_RATE", 0.0)),
+    "error_status": int(os.getenv("MOCK_AI_ERROR_STATUS", 503)),
+    # доля «медленных» запросов и их задержка (хвост латентности)
+    "slow_rate": float(os.getenv("MOCK_AI_SLOW_RATE", 0.0)),
+    "slow_latency": float(os.getenv("MOCK_AI_SLOW_LATENCY", 5.0)),
+    # доля запросов, которые висят до таймаута клиента
+    "hang_rate": float(os.getenv("MOCK_AI_HANG_RATE", 0.0)),
+}
+
+
+# Схема запроса от твоего эндпоинта (см. app/ai/client.py)
 class AIRequest(BaseModel):
-    question: str
-    history: List[Dict[str, str]]  # [{"role": "user"/"assistant", "text": ...}]
+    query: str
+    session_id: str | None = None
+    history: List[Dict[str, str]] = []  # [{"role": "user"/"assistant", "text": ...}]
+    stream: bool = False
 
 # Схема ответа
 class AIResponse(BaseModel):
     answer: str
+    tokens_used: int = 0
+    category: str = "mock"
 
-@app.post("/assistant/query", response_model=AIResponse)
-async def mock_query(data: AIRequest):
+
+def make_answer(data: AIRequest) -> str:
     # Просто возвращаем эхо-ответ + количество сообщений в истории
     history_len = len(data.history)
-    return AIResponse(answer=f"[Mock AI] Вы спросили: {data.question}. История сообщений: {history_len} шт.")
+    return f"[Mock AI] Вы спросили: {data.query}. История сообщений: {history_len} шт."
+
+
+async def stream_answer(answer: str):
+    # Отдаём ответ по словам в формате Server-Sent Events
+    for i, word in enumerate(answer.split(" ")):
+        delta = word if i == 0 else " " + word
+        yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        if MOCK_AI_CHUNK_DELAY:
+            await asyncio.sleep(MOCK_AI_CHUNK_DELAY)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/assistant/query", response_model=AIResponse)
+async def mock_query(data: AIRequest):
+    if MOCK_AI_LATENCY:
+        await asyncio.sleep(MOCK_AI_LATENCY)
+    if random.random() < FAULTS["hang_rate"]:
+        await asyncio.sleep(3600)
+    if random.random() < FAULTS["slow_rate"]:
+        await asyncio.sleep(FAULTS["slow_latency"])
+    if random.random() < FAULTS["error_rate"]:
+        return JSONResponse({"detail": "injected fault"}, status_code=FAULTS["error_status"])
+    answer = make_answer(data)
+    if data.stream:
+        return StreamingResponse(stream_answer(answer), media_type="text/event-stream")
+    return AIResponse(answer=answer)
+
+
+@app.get("/mock/faults")
+async def get_faults():
+    return FAULTS
+
+
+@app.post("/mock/faults")
+async def set_faults(faults: Dict[str, float]):
+    for name, value in faults.items():
+        if name in FAULTS:
+            FAULTS[name] = type(FAULTS[name])(value)
+    return FAULTS
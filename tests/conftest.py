@@ -0,0 +1,30 @@
+import asyncio
+import os
+
+# config.py требует адрес AI при импорте; до него тестам дальше не нужно
+os.environ.setdefault("AI_BASE_URL", "http://ai.test")
+os.environ.setdefault("AI_API_KEY", "test")
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import models
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Свежая SQLite-БД со схемой create_all и включёнными внешними ключами."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+
+    asyncio.run(create())
+    return async_sessionmaker(engine, expire_on_commit=False)
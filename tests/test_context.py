@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+os.environ.setdefault("AI_BASE_URL", "http://ai.test")
+os.environ.setdefault("AI_API_KEY", "test")
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import models
+from app.chat import context
+from app.models import User, Session, Message
+
+
+def run_build(tmp_path, monkeypatch, texts, **limits):
+    """Сессия с сообщениями texts; build_context дважды. Ответ: (ids, history1, history2, session)."""
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'context.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with session_factory() as db:
+                user = User(username="u", password_hash="x")
+                db.add(user)
+                await db.flush()
+                session_obj = Session(user_id=user.id, title="t")
+                db.add(session_obj)
+                await db.flush()
+                messages = [
+                    Message(session_id=session_obj.id, role="user" if i % 2 == 0 else "assistant", text=text)
+                    for i, text in enumerate(texts)
+                ]
+                db.add_all(messages)
+                await db.commit()
+                ids = [m.id for m in messages]
+
+            async with session_factory() as db:
+                first = await context.build_context(db, session_obj.id, user.id)
+            async with session_factory() as db:
+                second = await context.build_context(db, session_obj.id, user.id)
+                stored = (await db.execute(select(Session).where(Session.id == session_obj.id))).scalar_one()
+            return ids, first, second, stored
+        finally:
+            await engine.dispose()
+
+    for name, value in limits.items():
+        monkeypatch.setattr(context, name, value)
+    return asyncio.run(scenario())
+
+
+def test_message_cap_folds_everything_older_than_window(tmp_path, monkeypatch):
+    texts = [f"msg{i}" for i in range(30)]
+
+    ids, first, second, stored = run_build(
+        tmp_path, monkeypatch, texts,
+        AI_CONTEXT_MAX_MESSAGES=20, AI_CONTEXT_MAX_CHARS=10_000, AI_SUMMARY_MAX_CHARS=10_000, OVERFLOW_BATCH=4,
+    )
+
+    assert first[0]["role"] == "system"
+    summary_lines = first[0]["text"].splitlines()[1:]
+    assert [line.split(": ", 1)[1] for line in summary_lines] == texts[:10]
+    assert [m["text"] for m in first[1:]] == texts[10:]
+    assert stored.summary_message_id == ids[9]
+    # Повторная сборка ничего не сворачивает заново
+    assert second == first
+
+
+def test_char_budget_and_message_cap_together(tmp_path, monkeypatch):
+    # 30 символов на сообщение: в бюджет 100 входят три, LIMIT — пять
+    texts = [f"{i:02d}" + "x" * 28 for i in range(12)]
+
+    ids, first, second, stored = run_build(
+        tmp_path, monkeypatch, texts,
+        AI_CONTEXT_MAX_MESSAGES=5, AI_CONTEXT_MAX_CHARS=100, AI_SUMMARY_MAX_CHARS=10_000, OVERFLOW_BATCH=500,
+    )
+
+    summary_lines = first[0]["text"].splitlines()[1:]
+    assert [line.split(": ", 1)[1] for line in summary_lines] == texts[:9]
+    assert [m["text"] for m in first[1:]] == texts[9:]
+    assert stored.summary_message_id == ids[8]
+    assert second == first
+
+
+def test_no_summary_when_everything_fits(tmp_path, monkeypatch):
+    texts = [f"msg{i}" for i in range(5)]
+
+    _, first, _, stored = run_build(tmp_path, monkeypatch, texts, AI_CONTEXT_MAX_MESSAGES=5, AI_CONTEXT_MAX_CHARS=10_000)
+
+    assert [m["text"] for m in first] == texts
+    assert stored.summary is None and stored.summary_message_id is None
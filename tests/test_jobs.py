@@ -0,0 +1,118 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from app.chat import jobs
+from app.chat.jobs import ChatJob, ChatJobs
+from app.models import ChatJobRecord, Message, Session, User
+
+
+def setup_jobs(session_factory, monkeypatch):
+    """Обе «копии процесса» пишут в одну БД; AI отвечает эхом и запоминает порядок."""
+    monkeypatch.setattr(jobs, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(jobs, "ReadSessionLocal", session_factory)
+    monkeypatch.setattr(jobs, "DEFER_DELAY", 0.02)
+    monkeypatch.setattr(jobs, "POLL_INTERVAL", 0.02)
+    calls = []
+
+    async def fake_ai(query, session_id, history, use_cache):
+        calls.append((query, [m["text"] for m in history]))
+        await asyncio.sleep(0.01)
+        return {"answer": f"re: {query}"}
+
+    monkeypatch.setattr(jobs, "ask_ai_assistant", fake_ai)
+    return calls
+
+
+async def create_session(session_factory) -> tuple[int, int]:
+    async with session_factory() as db:
+        user = User(username="u", password_hash="x")
+        db.add(user)
+        await db.flush()
+        session_obj = Session(user_id=user.id, title="t")
+        db.add(session_obj)
+        await db.commit()
+        return user.id, session_obj.id
+
+
+def test_turns_of_one_session_keep_order_across_processes(session_factory, monkeypatch):
+    calls = setup_jobs(session_factory, monkeypatch)
+
+    async def scenario():
+        user_id, session_id = await create_session(session_factory)
+        first, second = ChatJobs(2, 10, 600, 900), ChatJobs(2, 10, 600, 900)
+
+        job1 = ChatJob(user_id=user_id, session_id=session_id, message="q1", use_cache=False)
+        await first.submit(job1)
+        job2 = ChatJob(user_id=user_id, session_id=session_id, message="q2", use_cache=False)
+        await second.submit(job2)
+
+        # Второй процесс не берёт ход, пока первый не выполнит предыдущий
+        await second.start()
+        await asyncio.sleep(0.1)
+        assert calls == [] and second.deferred > 0
+        # Задание первого процесса видно из второго
+        assert (await jobs.read_job(job1.id, user_id)).status == "queued"
+
+        await first.start()
+        await asyncio.wait_for(job2.done.wait(), 2)
+        out = await jobs.read_job(job1.id, user_id, wait=1)
+        foreign = await jobs.read_job(job1.id, user_id + 1)
+        await first.stop()
+        await second.stop()
+
+        async with session_factory() as db:
+            texts = (await db.scalars(select(Message.text).order_by(Message.id))).all()
+        return out, foreign, job2, texts
+
+    out, foreign, job2, texts = asyncio.run(scenario())
+
+    assert calls == [("q1", []), ("q2", ["q1", "re: q1"])]
+    assert texts == ["q1", "re: q1", "q2", "re: q2"]
+    assert (out.status, out.answer) == ("done", "re: q1")
+    assert foreign is None
+    assert (job2.status, job2.answer) == ("done", "re: q2")
+
+
+def test_stale_job_does_not_block_and_is_purged(session_factory, monkeypatch):
+    calls = setup_jobs(session_factory, monkeypatch)
+
+    async def scenario():
+        user_id, session_id = await create_session(session_factory)
+        # Ход, взятый процессом, который потом упал
+        async with session_factory() as db:
+            lost = ChatJobRecord(id="lost", user_id=user_id, session_id=session_id, status="running")
+            db.add(lost)
+            await db.flush()
+            lost.created_at = jobs._utcnow() - timedelta(seconds=1000)
+            await db.commit()
+
+        worker = ChatJobs(1, 10, 600, 900)
+        await worker.start()
+        job = ChatJob(user_id=user_id, session_id=session_id, message="q", use_cache=False)
+        await worker.submit(job)
+        await asyncio.wait_for(job.done.wait(), 2)
+        await worker.stop()
+        return await jobs.read_job("lost", user_id), job
+
+    lost, job = asyncio.run(scenario())
+
+    assert job.status == "done" and calls == [("q", [])]
+    assert (lost.status, lost.error) == ("failed", "Задание потеряно")
+
+
+def test_stop_marks_unfinished_jobs_failed_in_db(session_factory, monkeypatch):
+    setup_jobs(session_factory, monkeypatch)
+
+    async def scenario():
+        user_id, session_id = await create_session(session_factory)
+        worker = ChatJobs(1, 10, 600, 900)
+        job = ChatJob(user_id=user_id, session_id=session_id, message="q", use_cache=False)
+        await worker.submit(job)
+        worker._tasks = [asyncio.create_task(asyncio.sleep(10))]  # воркер, который не успел
+        await worker.stop(timeout=0.05)
+        return await jobs.read_job(job.id, user_id)
+
+    out = asyncio.run(scenario())
+    assert (out.status, out.error) == ("failed", "Сервер остановлен")
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+
+from app.ai import client
+from app.ai.breaker import CircuitBreaker, CircuitOpen, CLOSED, OPEN, HALF_OPEN
+from app.ai.limiter import UpstreamBusy, UpstreamLimiter
+from app.ai.singleflight import SingleFlight
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(window=60, min_calls=4, failure_rate=0.5, open_seconds=0.05, probes=1)
+
+    for failed in (False, True, False):
+        assert breaker.allow() is False
+        breaker.record(failed)
+    assert breaker.state == CLOSED
+    breaker.allow()
+    breaker.record(True)
+    # 2 отказа из 4 — цепь разомкнута, вызовы отбиваются сразу
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() is True  # проба
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()  # вторая проба сверх probes
+    breaker.record(True, probe=True)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.record(False, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["times_opened"] == 2
+
+
+def test_breaker_releases_cancelled_probe():
+    breaker = CircuitBreaker(window=60, min_calls=1, failure_rate=0.5, open_seconds=0.01, probes=1)
+    breaker.allow()
+    breaker.record(True)
+    time.sleep(0.02)
+
+    assert breaker.allow() is True
+    breaker.record(None, probe=True)
+    # Исход отменённой пробы неизвестен: цепь ждёт следующую
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is True
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["answer"] * 5
+    assert calls == 1
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_singleflight_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_limiter_raises_busy_on_timeout_and_full_queue():
+    async def scenario():
+        limiter = UpstreamLimiter(max_in_flight=1, max_waiting=1, queue_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(UpstreamBusy):
+                async with limiter.slot():
+                    pass
+
+            waiter = asyncio.ensure_future(limiter.slot().__aenter__())
+            await asyncio.sleep(0)
+            assert limiter.waiting == 1
+            # Очередь полна — отказ без ожидания
+            with pytest.raises(UpstreamBusy):
+                limiter.check()
+            with pytest.raises(UpstreamBusy):
+                await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.stats() == {"max_in_flight": 1, "in_flight": 0, "waiting": 0, "rejected": 1, "timed_out": 2}
+
+
+def run_hedged(monkeypatch, max_in_flight):
+    """Первый вызов fn висит, второй отвечает сразу. Ответ: (результат, пик in_flight, лимитер)."""
+    limiter = UpstreamLimiter(max_in_flight, max_waiting=10, queue_timeout=1)
+    monkeypatch.setattr(client, "upstream_limiter", limiter)
+    monkeypatch.setattr(client, "hedge_delay", lambda: 0.01)
+    peak = 0
+    calls = 0
+
+    async def fn():
+        nonlocal peak, calls
+        calls += 1
+        peak = max(peak, limiter.in_flight)
+        if calls == 1:
+            await asyncio.sleep(0.1)
+            return "primary"
+        return "hedge"
+
+    async def scenario():
+        async with limiter.slot():
+            return await client.with_hedging(fn)
+
+    result = asyncio.run(scenario())
+    return result, peak, limiter
+
+
+def test_hedge_skipped_when_limiter_is_full(monkeypatch):
+    result, peak, limiter = run_hedged(monkeypatch, max_in_flight=1)
+
+    assert result == "primary"
+    assert peak == 1
+    assert limiter.in_flight == 0
+
+
+def test_hedge_takes_and_returns_its_own_slot(monkeypatch):
+    result, peak, limiter = run_hedged(monkeypatch, max_in_flight=2)
+
+    assert result == "hedge"
+    assert peak == 2
+    assert limiter.in_flight == 0
+    assert not limiter._semaphore.locked()
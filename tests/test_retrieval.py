@@ -0,0 +1,235 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import delete
+
+from app.ai import client, retrieval
+from app.ai.retrieval import FAQ_PATH, RetrievalIndex, key_terms
+from app.core.config import RETRIEVAL_THRESHOLD
+from app.models import Message, Session, User
+
+FAQ = json.loads(FAQ_PATH.read_text())
+
+
+def faq_answer(question: str) -> str:
+    return next(item["answer"] for item in FAQ if question in item["questions"])
+
+
+# Пересказы вопросов FAQ -> вопрос FAQ, чей ответ должен прийти
+PARAPHRASES = [
+    ("срок уплаты ндс за квартал", "Когда платить НДС?"),
+    ("До какого числа платить НДС?", "Когда платить НДС?"),
+    ("когда сдавать декларацию ндс", "Когда сдавать декларацию по НДС?"),
+    ("сроки сдачи отчета 6-ндфл", "Сроки сдачи 6-НДФЛ"),
+    ("срок уплаты НДФЛ с зарплаты сотрудников", "Когда перечислять НДФЛ с зарплаты?"),
+    ("срок подачи уведомления по енп", "Когда подавать уведомление по ЕНП?"),
+    ("что такое единый налоговый счет", "Что такое ЕНП и ЕНС?"),
+    ("когда платить налог по упрощенке", "Когда платить налог по УСН?"),
+    ("до какого числа сдавать декларацию по усн", "Когда платить налог по УСН?"),
+    ("когда платить страховые взносы за работников", "Когда платить страховые взносы за сотрудников?"),
+    ("какие взносы ИП платит за себя", "Какие взносы платит ИП за себя?"),
+    ("срок сдачи персонифицированных сведений", "Когда сдавать персонифицированные сведения?"),
+    ("когда подавать ефс-1 при увольнении", "Когда подавать ЕФС-1 при приёме на работу?"),
+    ("сколько лет хранить первичные документы", "Сколько хранить первичные документы?"),
+    ("когда платить налог на прибыль организаций", "Когда платить налог на прибыль?"),
+    ("как часто платить зарплату", "Как часто нужно выплачивать зарплату?"),
+    ("за сколько дней платить отпускные", "Когда выплатить отпускные?"),
+    ("кто платит за больничный", "Кто оплачивает больничный?"),
+]
+
+# Соседние вопросы, на которые в FAQ ответа нет: по n-граммам они близки
+# к известным (НДФЛ ~ НДС, ООО ~ ИП), но ответ оттуда был бы неверным
+NEAR_MISSES = [
+    "Когда сдавать декларацию 3-НДФЛ?",
+    "Какие взносы платит ООО за себя?",
+    "налог по патенту",
+    "Когда сдавать декларацию по налогу на имущество?",
+    "Сколько хранить кадровые документы?",
+    "Какие взносы платит самозанятый?",
+    "Когда платить транспортный налог?",
+    "Срок уплаты НДС для ИП на патенте",
+    "Когда сдавать статистическую отчетность?",
+    "Когда платить торговый сбор?",
+]
+
+
+@pytest.fixture
+def faq_index(tmp_path):
+    index = RetrievalIndex(str(tmp_path / "index"), FAQ_PATH, RETRIEVAL_THRESHOLD)
+    asyncio.run(index.refresh())
+    return index
+
+
+@pytest.mark.parametrize("query, question", PARAPHRASES)
+def test_paraphrase_gets_faq_answer(faq_index, query, question):
+    found = asyncio.run(faq_index.answer(query))
+    assert found is not None and found["answer"] == faq_answer(question)
+
+
+@pytest.mark.parametrize("query", NEAR_MISSES)
+def test_near_miss_goes_to_ai(faq_index, query):
+    assert asyncio.run(faq_index.answer(query)) is None
+
+
+def test_ndfl_is_never_answered_with_vat(faq_index):
+    # Самый похожий вопрос — «Когда платить НДС?» (сходство ~0.78)
+    found = asyncio.run(faq_index.answer("Когда платить НДФЛ?"))
+    assert found is None or "НДФЛ" in found["answer"]
+
+
+def test_key_terms():
+    assert key_terms("Когда сдавать 3-НДФЛ для ИП?") == {"3-ндфл", "ип"}
+    assert key_terms("срок 6 ндфл") == {"6-ндфл"}
+    assert key_terms("Налог на доходы физлиц") == {"ндфл"}
+    assert key_terms("Взносы ООО за себя") == {"взносы", "ооо"}
+    assert key_terms("Упрощёнка или патент?") == {"усн", "патент"}
+    assert key_terms("Как часто платить зарплату") == frozenset()
+
+
+def test_new_approvals_are_appended_removals_rebuild(faq_index, monkeypatch):
+    async def all_alive(session_ids):
+        return session_ids
+
+    monkeypatch.setattr(retrieval, "_existing_sessions", all_alive)
+    directory = faq_index.directory
+    first = faq_index._view.meta
+    docs = [
+        {"q": f"Как учесть расходы на аренду офиса {i}?", "a": f"ответ {i}", "src": "history", "sid": i}
+        for i in range(3)
+    ]
+
+    retrieval._write_approved(directory, docs[:2])
+    asyncio.run(faq_index.refresh())
+    appended = faq_index._view.meta
+    retrieval._write_approved(directory, docs)
+    asyncio.run(faq_index.refresh())
+    appended_again = faq_index._view.meta
+
+    # Файлы поколения дописаны, ничего не пересобрано
+    assert appended["generation"] == appended_again["generation"] == first["generation"]
+    assert appended_again["docs"] == first["docs"] + 3
+    found = asyncio.run(faq_index.answer("Как учесть расходы на аренду офиса 2?"))
+    assert found["answer"] == "ответ 2"
+
+    retrieval._write_approved(directory, docs[1:])
+    asyncio.run(faq_index.refresh())
+    rebuilt = faq_index._view.meta
+    assert rebuilt["generation"] == first["generation"] + 1
+    assert rebuilt["docs"] == first["docs"] + 2
+    assert sorted(p.name.split(".")[0] for p in directory.glob("*.docs")) == [str(rebuilt["generation"])]
+
+
+def test_threshold_decides_between_index_and_ai(tmp_path):
+    query, question = PARAPHRASES[0]
+    strict = RetrievalIndex(str(tmp_path / "strict"), FAQ_PATH, 0.99)
+    loose = RetrievalIndex(str(tmp_path / "loose"), FAQ_PATH, 0.3)
+    asyncio.run(strict.refresh())
+    asyncio.run(loose.refresh())
+
+    assert asyncio.run(strict.answer(query)) is None
+    assert asyncio.run(loose.answer(query))["answer"] == faq_answer(question)
+    assert (strict.misses, loose.hits) == (1, 1)
+
+
+# --- Одобрение ответов из истории ---
+
+async def add_sessions(session_factory, questions: list[str]) -> list[int]:
+    """Сессии «вопрос — ответ AI», по одной на вопрос. Ответ: id сессий."""
+    async with session_factory() as db:
+        user = User(username="u", password_hash="x")
+        db.add(user)
+        await db.flush()
+        ids = []
+        for question in questions:
+            session_obj = Session(user_id=user.id, title=question)
+            db.add(session_obj)
+            await db.flush()
+            db.add_all([
+                Message(session_id=session_obj.id, role="user", text=question),
+                Message(session_id=session_obj.id, role="assistant", text=f"Ответ: {question}"),
+            ])
+            ids.append(session_obj.id)
+        await db.commit()
+    return ids
+
+
+@pytest.fixture
+def history_index(tmp_path, session_factory, monkeypatch):
+    monkeypatch.setattr(retrieval, "ReadSessionLocal", session_factory)
+    return RetrievalIndex(str(tmp_path / "index"), FAQ_PATH, RETRIEVAL_THRESHOLD)
+
+
+def test_approve_and_revoke(history_index, session_factory):
+    question = "Как учесть расходы на аренду офиса?"
+
+    async def scenario():
+        [sid] = await add_sessions(session_factory, [question])
+        assert await history_index.candidates(10) == [
+            {"session_id": sid, "question": question, "answer": f"Ответ: {question}"}
+        ]
+        doc = await history_index.approve(sid)
+        approved = await history_index.answer("как учесть расходы на аренду офиса")
+        candidates = await history_index.candidates(10)
+        revoked = await history_index.revoke(sid)
+        after = await history_index.answer("как учесть расходы на аренду офиса")
+        return doc, approved, candidates, revoked, after, await history_index.revoke(sid)
+
+    doc, approved, candidates, revoked, after, revoked_twice = asyncio.run(scenario())
+
+    assert doc == {"q": question, "a": f"Ответ: {question}", "src": "history", "sid": 1}
+    assert (approved["answer"], approved["source"]) == (f"Ответ: {question}", "history")
+    assert candidates == []
+    assert revoked is True and after is None
+    assert revoked_twice is False
+
+
+def test_deleted_session_leaves_index(history_index, session_factory):
+    question = "Как учесть расходы на аренду офиса?"
+
+    async def scenario():
+        [sid] = await add_sessions(session_factory, [question])
+        await history_index.approve(sid)
+        async with session_factory() as db:
+            await db.execute(delete(Session).where(Session.id == sid))
+            await db.commit()
+        await history_index.refresh()
+        return await history_index.answer(question)
+
+    assert asyncio.run(scenario()) is None
+    assert retrieval.read_approved(history_index.directory) == []
+
+
+def test_eviction_keeps_newest_approvals(history_index, session_factory, monkeypatch):
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MAX_APPROVED", 10)
+    questions = [f"Как учесть расходы на аренду склада номер {i}?" for i in range(11)]
+
+    async def scenario():
+        ids = await add_sessions(session_factory, questions)
+        for sid in ids:
+            await history_index.approve(sid)
+        return ids
+
+    ids = asyncio.run(scenario())
+
+    # Сверх лимита вытесняется сразу десятая часть, начиная с давних
+    assert [doc["sid"] for doc in retrieval.read_approved(history_index.directory)] == ids[2:]
+    assert history_index.stats()["docs"] == sum(len(item["questions"]) for item in FAQ) + 9
+
+
+def test_index_is_asked_only_at_start_of_conversation(monkeypatch):
+    calls = []
+
+    class FakeIndex:
+        async def answer(self, query):
+            calls.append(query)
+            return {"answer": "из индекса", "source": "faq", "score": 1.0}
+
+    monkeypatch.setattr(client, "retrieval_index", FakeIndex())
+    history = [{"role": "user", "text": "Мы на УСН"}, {"role": "assistant", "text": "Понятно"}]
+
+    assert asyncio.run(client.get_cached_answer("Когда платить? (тест индекса)", history)) is None
+    assert calls == []
+    found = asyncio.run(client.get_cached_answer("Когда платить? (тест индекса)", []))
+    assert found["answer"] == "из индекса"
+    assert calls == ["Когда платить? (тест индекса)"]
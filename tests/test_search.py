@@ -0,0 +1,59 @@
+import os
+
+os.environ.setdefault("AI_BASE_URL", "http://ai.test")
+os.environ.setdefault("AI_API_KEY", "test")
+
+from app.history.search import render_snippet, _MARK_OPEN, _MARK_CLOSE
+
+
+def test_snippet_escapes_message_text_but_keeps_highlight():
+    raw = f"<img src=x onerror=alert(1)> {_MARK_OPEN}налог{_MARK_CLOSE} & <b>"
+    assert render_snippet(raw) == "&lt;img src=x onerror=alert(1)&gt; <mark>налог</mark> &amp; &lt;b&gt;"
+
+
+def test_archived_session_stays_searchable(session_factory):
+    import asyncio
+    from sqlalchemy import delete, text
+
+    from app.history.archive import archive_session
+    from app.history.search import search_messages
+    from app.models import User, Session, Message
+
+    async def scenario():
+        async with session_factory() as db:
+            user = User(username="u", password_hash="x")
+            db.add(user)
+            await db.flush()
+            session_obj = Session(user_id=user.id, title="Амортизация")
+            db.add(session_obj)
+            await db.flush()
+            db.add_all([
+                Message(session_id=session_obj.id, role="user", text="Как считать амортизацию?"),
+                Message(session_id=session_obj.id, role="assistant", text="Амортизация ёлки <b>линейно</b>"),
+            ])
+            await db.commit()
+
+        async with session_factory() as db:
+            moved = await archive_session(db, session_obj.id)
+        async with session_factory() as db:
+            hits = await search_messages(db, user.id, "амортизации", 10)
+            by_yo = await search_messages(db, user.id, "елки", 10)
+            foreign = await search_messages(db, user.id + 1, "амортизации", 10)
+            await db.execute(delete(Session).where(Session.id == session_obj.id))
+            await db.commit()
+        async with session_factory() as db:
+            after_delete = await search_messages(db, user.id, "амортизации", 10)
+            indexed = (await db.execute(text("SELECT count(*) FROM archive_fts"))).scalar()
+        return moved, hits, by_yo, foreign, after_delete, indexed
+
+    moved, hits, by_yo, foreign, after_delete, indexed = asyncio.run(scenario())
+
+    assert moved["messages"] == 2
+    assert {hit["role"] for hit in hits} == {"user", "assistant"}
+    assert all(hit["session_title"] == "Амортизация" for hit in hits)
+    assert "<mark>амортизацию</mark>" in next(h["snippet"] for h in hits if h["role"] == "user")
+    assert "&lt;b&gt;" in by_yo[0]["snippet"]
+    assert foreign == []
+    assert after_delete == []
+    # Каскад от сессии удалил и строки индекса архива
+    assert indexed == 0